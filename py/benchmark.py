@@ -0,0 +1,311 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import OrderedDict
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import competitors
+import fastr
+import lsh
+import preparation
+import synthetic
+
+"""
+This file benchmarks the hot paths of lsh, fastr and competitors (shingling,
+minhashing, LSH bucketing and queries, euclidean distances, FAST++, FAST-CS,
+FAST-pw, GA, ART-D and ART-F) on the bundled subjects and on synthetic test
+suites of increasing size. Each benchmark is timed several times (best and
+median), then run once more under tracemalloc to measure its allocations; the
+time per operation (test case, query, distance or selected test case) and the
+allocations are stored as JSON, so that two commits can be compared offline
+(python3 py/benchmark.py compare <baselineFile> <outputFile>).
+"""
+
+SUBJECTS = [("flex", "v3"), ("grep", "v3"), ("gzip", "v1"), ("make", "v1"),
+            ("sed", "v6"), ("chart", "v0"), ("closure", "v0"), ("lang", "v0"),
+            ("math", "v0"), ("time", "v0")]
+
+# parameters of the benchmarked algorithms
+k, n, r, b = 5, 10, 1, 10
+dim = 10
+BUDGET = 100    # test cases selected by the reducers
+QUERIES = 200   # LSH queries, distance computations, tcMinhashing calls
+SEED = 0
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Test suites
+
+# test suites of the benchmark: (name, bboxFile, coverageFile)
+def testSuites(subjects, sizes, directory):
+    suites = []
+    for prog, v in subjects:
+        suites.append(("{}_{}".format(prog, v),
+                       "input/{}_{}/{}-bbox.txt".format(prog, v, prog),
+                       "input/{}_{}/{}-function.txt".format(prog, v, prog)))
+    for N in sizes:
+        bboxFile, coverageFile, faultMatrix = synthetic.generate(
+            os.path.join(directory, "synthetic{}".format(N)), "synthetic", N,
+            seed=SEED)
+        suites.append(("synthetic{}".format(N), bboxFile, coverageFile))
+    return suites
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Benchmarks
+# each benchmark prepares its input (not measured) and returns the measured
+# function and the number of operations it performs
+
+def benchShingles(bboxFile, coverageFile):
+    lines = [line.rstrip("\n") for line in open(bboxFile)]
+    return lambda: [lsh.rollingShingles(tc, k) for tc in lines], len(lines)
+
+def benchTcMinhashing(bboxFile, coverageFile):
+    shingles = list(fastr.loadTestSuite(bboxFile, bbox=True, k=k).items())
+    sample = random.Random(SEED).sample(shingles, min(QUERIES, len(shingles)))
+    hashes = [lsh.hashFamily(i) for i in range(n)]
+    return (lambda: [lsh.tcMinhashing(tc, hashes) for tc in sample],
+            len(sample))
+
+def benchMinhashSignatures(bboxFile, coverageFile):
+    TS = fastr.loadTestSuite(bboxFile, bbox=True, k=k)
+    shingles = [lsh.shingleIDs(tc) for tc in TS.values()]
+    return lambda: lsh.minhashSignatures(shingles, n), len(shingles)
+
+# signatures of the bbox test cases
+def signatures(bboxFile):
+    TS = fastr.loadTestSuite(bboxFile, bbox=True, k=k)
+    tcIDs = list(TS.keys())
+    return tcIDs, lsh.minhashSignatures(
+        [lsh.shingleIDs(tc) for tc in TS.values()], n)
+
+def benchLSHBucket(bboxFile, coverageFile):
+    tcIDs, sigs = signatures(bboxFile)
+    minhashes = list(zip(tcIDs, sigs))
+    return lambda: lsh.LSHBucket(minhashes, b, r, n), len(tcIDs)
+
+def benchLSHIndexQuery(bboxFile, coverageFile):
+    tcIDs, sigs = signatures(bboxFile)
+    index = lsh.LSHIndex(tcIDs, sigs, b, r, n)
+    rows = random.Random(SEED).sample(range(len(tcIDs)),
+                                      min(QUERIES, len(tcIDs)))
+    return lambda: [index.candidateRows(sigs[row]) for row in rows], len(rows)
+
+def benchSqDistances(bboxFile, coverageFile):
+    TS = preparation.preparation(bboxFile, dim=dim, seed=SEED)
+    norms = preparation.sqNorms(TS)
+    rows = random.Random(SEED).sample(range(TS.shape[0]),
+                                      min(QUERIES, TS.shape[0]))
+    return (lambda: [preparation.sqDistances(TS, row, norms) for row in rows],
+            len(rows) * TS.shape[0])
+
+def benchReductionPlusPlus(bboxFile, coverageFile):
+    TS = preparation.preparation(bboxFile, dim=dim, seed=SEED)
+    B = min(BUDGET, TS.shape[0])
+    return lambda: fastr.reductionPlusPlus(TS, B), B
+
+def benchReductionCS(bboxFile, coverageFile):
+    TS = preparation.preparation(bboxFile, dim=dim, seed=SEED)
+    B = min(BUDGET, TS.shape[0])
+    return lambda: fastr.reductionCS(TS, B), B
+
+# end-to-end reducers (ops: selected test cases)
+def benchReducer(reducer, bbox):
+    def bench(bboxFile, coverageFile):
+        inputFile = bboxFile if bbox else coverageFile
+        B = min(BUDGET, preparation.countTestCases(inputFile))
+        return lambda: reducer(inputFile, B), B
+    return bench
+
+BENCHMARKS = OrderedDict([
+    ("lsh.rollingShingles", benchShingles),
+    ("lsh.tcMinhashing", benchTcMinhashing),
+    ("lsh.minhashSignatures", benchMinhashSignatures),
+    ("lsh.LSHBucket", benchLSHBucket),
+    ("lsh.LSHIndex.candidateRows", benchLSHIndexQuery),
+    ("preparation.sqDistances", benchSqDistances),
+    ("fastr.reductionPlusPlus", benchReductionPlusPlus),
+    ("fastr.reductionCS", benchReductionCS),
+    ("fastr.fast_pw", benchReducer(
+        lambda f, B: fastr.fast_pw(f, r, b, bbox=True, k=k, memory=True, B=B),
+        True)),
+    ("competitors.ga", benchReducer(
+        lambda f, B: competitors.ga(f, B=B), False)),
+    ("competitors.artd", benchReducer(
+        lambda f, B: competitors.artd(f, B=B), False)),
+    ("competitors.artf", benchReducer(
+        lambda f, B: competitors.artf(f, B=B), False)),
+])
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Measures
+
+# same random choices in every run
+def reseed():
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+# time a benchmark and measure its allocations
+def measure(run, ops, repeat):
+    """INPUT
+    (function)run: measured function
+    (int)ops: number of operations of run
+    (int)repeat: number of timed runs
+
+    OUTPUT
+    (dict)measures: best and median time, time per operation (best), peak
+    and retained allocations (bytes) and the profile of the last timed run,
+    if run returns a reducer result"""
+    times = []
+    for _ in range(repeat):
+        reseed()
+        gc.collect()
+        t0 = time.perf_counter()
+        output = run()
+        times.append(time.perf_counter() - t0)
+
+    reseed()
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    if not tracing:
+        tracemalloc.stop()
+
+    best = min(times)
+    return {"ops": ops, "repeat": repeat, "best": best,
+            "median": statistics.median(times),
+            "perOp": best / max(ops, 1),
+            "peakAlloc": peak - before, "retainedAlloc": current - before,
+            "profile": output.report() if hasattr(output, "report") else None}
+
+# run the benchmarks on the test suites
+def benchmark(suites, repeat=5, benchmarks=BENCHMARKS, log=sys.stderr):
+    results = []
+    for suite, bboxFile, coverageFile in suites:
+        N = preparation.countTestCases(bboxFile)
+        for name, bench in benchmarks.items():
+            run, ops = bench(bboxFile, coverageFile)
+            result = OrderedDict([("benchmark", name), ("suite", suite),
+                                  ("N", N)])
+            result.update(measure(run, ops, repeat))
+            results.append(result)
+            log.write("{} {} {}/op\n".format(suite, name, result["perOp"]))
+            log.flush()
+    return results
+
+# current commit of the repository (None outside a git repository)
+def gitCommit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return {"commit": gitCommit(), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(),
+            "processor": platform.processor(), "date": time.time()}
+
+# compare the results of two runs (ratio > 1: slower than the baseline)
+def compare(baseline, current):
+    """INPUT
+    (dict)baseline: stored results of the baseline run
+    (dict)current: stored results of the compared run
+
+    OUTPUT
+    (list)rows: (benchmark, suite, baseline perOp, perOp, time ratio,
+    baseline peakAlloc, peakAlloc) of the benchmarks of both runs"""
+    old = {(m["benchmark"], m["suite"]): m for m in baseline["results"]}
+    rows = []
+    for m in current["results"]:
+        o = old.get((m["benchmark"], m["suite"]))
+        if o is None:
+            continue
+        ratio = m["perOp"] / o["perOp"] if o["perOp"] > 0 else float("inf")
+        rows.append((m["benchmark"], m["suite"], o["perOp"], m["perOp"],
+                     ratio, o["peakAlloc"], m["peakAlloc"]))
+    return rows
+
+
+usage = """USAGE: python3 py/benchmark.py <outputFile> <subjects> <sizes> <repeat>
+       python3 py/benchmark.py compare <baselineFile> <outputFile>
+OPTIONS:
+  <outputFile>: JSON file of the results
+  <subjects>: bundled subjects, e.g. flex_v3,grep_v3
+    options: comma-separated <program>_<version>, all, none
+  <sizes>: number of test cases of the synthetic test suites, e.g. 1000,10000
+    options: comma-separated positive integers, none
+  <repeat>: number of timed runs of each benchmark
+  <baselineFile>: JSON file of the results of the baseline commit"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        script, cmd, baselineFile, outputFile = sys.argv
+        baseline = json.load(open(baselineFile))
+        current = json.load(open(outputFile))
+        print("Baseline: {}".format(baseline["environment"]["commit"]))
+        print("Current: {}".format(current["environment"]["commit"]))
+        print("benchmark suite perOp(baseline) perOp ratio "
+              "peakAlloc(baseline) peakAlloc")
+        for row in compare(baseline, current):
+            print(row[0], row[1], row[2], row[3], round(row[4], 3),
+                  row[5], row[6])
+        exit()
+
+    if len(sys.argv) != 5:
+        print(usage)
+        exit()
+
+    script, outputFile, subjects, sizes, repeat = sys.argv
+    if subjects == "all":
+        subjects = SUBJECTS
+    elif subjects == "none":
+        subjects = []
+    else:
+        subjects = [tuple(s.rsplit("_", 1)) for s in subjects.split(",")]
+    sizes = [] if sizes == "none" else [int(N) for N in sizes.split(",")]
+
+    directory = tempfile.mkdtemp(prefix="fastr-benchmark-")
+    try:
+        results = benchmark(testSuites(subjects, sizes, directory),
+                            repeat=int(repeat))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(outputFile, "w") as fout:
+        json.dump({"environment": environment(), "results": results}, fout,
+                  indent=1)
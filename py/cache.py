@@ -0,0 +1,224 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import json
+import os
+import sys
+
+import inputs
+import lsh
+
+"""
+This file implements the artifact cache shared by fastr and fastr_adequate.
+Artifacts (.sig signatures, .keys LSH band keys, .rp projections) are keyed
+by the content of the input file and by every parameter they depend on, so a
+cached artifact is reused only if it is the one that would be rebuilt.
+Artifacts are written atomically (temporary file + rename, metadata last), and
+the least recently used ones are evicted when the cache grows over its size
+limit.
+
+The cache directory and its size limit (bytes) can be set with the FASTR_CACHE
+and FASTR_CACHE_SIZE environment variables.
+"""
+
+# version of the key scheme (bump to invalidate every cached artifact)
+CACHE_VERSION = 1
+CACHE_DIR = ".fastr_cache"
+CACHE_SIZE = 16 << 30
+META_EXT = ".json"
+# permissions of a cached artifact (never modified once written)
+READ_ONLY = 0o444
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# (path, size, mtime) of the parts -> checksum, so each input is hashed once
+# per process
+_checksums = {}
+
+# content hash of an input file (or of the parts of a split input)
+def inputChecksum(input_file):
+    stamp = inputs.inputStamp(input_file)
+    if stamp not in _checksums:
+        _checksums[stamp] = lsh.fileChecksum(input_file)
+    return _checksums[stamp]
+
+# key of an artifact built from input_file with the given parameters
+def artifactKey(kind, input_file, params):
+    """INPUT
+    (str)kind: kind of artifact (e.g., "sig", "rp")
+    (str)input_file: input the artifact is built from
+    (dict)params: all the parameters the artifact depends on (JSON values)
+
+    OUTPUT
+    (str)key: hex digest identifying the artifact"""
+    desc = {"version": CACHE_VERSION, "kind": kind,
+            "input": inputChecksum(input_file),
+            "size": inputs.inputSize(input_file), "params": params}
+    raw = json.dumps(desc, sort_keys=True).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class ArtifactCache(object):
+    """Directory of artifacts: <key><ext> and its metadata <key><ext>.json"""
+
+    def __init__(self, root=None, maxSize=None):
+        if root is None:
+            root = os.environ.get("FASTR_CACHE", CACHE_DIR)
+        if maxSize is None:
+            maxSize = int(os.environ.get("FASTR_CACHE_SIZE", CACHE_SIZE))
+        self.root = root
+        self.maxSize = maxSize
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def path(self, kind, input_file, params, ext=""):
+        return os.path.join(self.root,
+                            artifactKey(kind, input_file, params) + ext)
+
+    # path and metadata of a cached artifact, building it on a miss
+    def fetch(self, kind, input_file, params, build, ext=""):
+        """INPUT
+        (str)kind: kind of artifact (e.g., "sig", "rp")
+        (str)input_file: input the artifact is built from
+        (dict)params: all the parameters the artifact depends on
+        (function)build: build(path) writes the artifact in path and returns
+        its metadata (dict of JSON values, e.g. the time taken to build it)
+        (str)ext: extension of the artifact file
+
+        OUTPUT
+        (pair)(path, meta): path of the artifact and its metadata (read-only:
+        an artifact is never modified, derived data is another artifact)"""
+        path = self.path(kind, input_file, params, ext)
+        meta = self.lookup(path)
+        if meta is not None:
+            self.stats["hits"] += 1
+            return path, meta
+
+        self.stats["misses"] += 1
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root, exist_ok=True)
+        tmp = "{}.tmp{}".format(path, os.getpid())
+        try:
+            meta = build(tmp)
+            # artifacts are immutable: readers may have them memory-mapped
+            os.chmod(tmp, READ_ONLY)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        meta = dict(meta, kind=kind, params=params,
+                    input=os.path.abspath(input_file))
+        self.storeMeta(path, meta)
+        self.evict(keep=path)
+        return path, meta
+
+    # metadata of a complete artifact (None if missing), marking it as used
+    def lookup(self, path):
+        try:
+            with open(path + META_EXT) as fin:
+                meta = json.load(fin)
+            os.utime(path)
+            os.utime(path + META_EXT)
+        except (IOError, OSError, ValueError):
+            return None
+        return meta
+
+    # the metadata file is written last: it marks the artifact as complete
+    def storeMeta(self, path, meta):
+        tmp = "{}{}.tmp{}".format(path, META_EXT, os.getpid())
+        with open(tmp, "w") as fout:
+            json.dump(meta, fout, sort_keys=True)
+        os.replace(tmp, path + META_EXT)
+
+    # (mtime, size, path) of every complete artifact
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            if not name.endswith(META_EXT):
+                continue
+            path = os.path.join(self.root, name[:-len(META_EXT)])
+            try:
+                st = os.stat(path)
+                size = st.st_size + os.path.getsize(path + META_EXT)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, size, path))
+        return entries
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    # remove least recently used artifacts until the cache fits in maxSize
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.maxSize:
+                break
+            if path == keep:
+                continue
+            self.remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def remove(self, path):
+        for p in (path + META_EXT, path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            self.remove(path)
+
+
+_default = None
+
+# cache used by fastr and fastr_adequate
+def defaultCache():
+    global _default
+    if _default is None:
+        _default = ArtifactCache()
+    return _default
+
+
+usage = """USAGE: python3 py/cache.py <command>
+OPTIONS:
+  <command>: list (artifacts, least recently used first) or clear.
+  The cache directory is FASTR_CACHE (default: .fastr_cache)."""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("list", "clear"):
+        print(usage)
+        exit()
+
+    cache = defaultCache()
+    if sys.argv[1] == "clear":
+        cache.clear()
+        exit()
+
+    for mtime, size, path in sorted(cache.entries()):
+        with open(path + META_EXT) as fin:
+            meta = json.load(fin)
+        print(os.path.basename(path), size, meta["kind"], meta["input"],
+              json.dumps(meta["params"], sort_keys=True))
+    print("Total: {} bytes (limit {})".format(cache.size(), cache.maxSize))
@@ -19,9 +19,13 @@ from functools import reduce
 from statistics import mean,stdev
 import random
 import time
-import sys
 
+import numpy as np
+
+import inputs
 import lsh
+import observers
+import profiling
 
 
 """
@@ -39,7 +43,7 @@ Each function returns: preparation time, reduction time, reduced test suite.
 # format: space-separated covered entities of one test case per line (wbox)
 def loadTestSuite(input_file, bbox=False, k=5):
     TS = {}
-    with open(input_file) as fin:
+    with inputs.openInput(input_file) as fin:
         tcID = 1
         for tc in fin:
             if bbox:
@@ -61,7 +65,9 @@ def loadTestSuite(input_file, bbox=False, k=5):
 
 
 # GREEDY SET COVER (ADDITIONAL)
-def ga(input_file, B=0):
+# (stream: yields each test case as soon as it is selected)
+def gaStream(input_file, B=0, max_seconds=None, deadline=None,
+             profiler=None):
     def select(TS, U, Cg):
         s, uncs_s = 0, -1
         for ui in U:
@@ -70,9 +76,10 @@ def ga(input_file, B=0):
                 s, uncs_s = ui, uncs
         return s
 
-    ptime_start = time.clock()
+    deadline = profiling.stopTime(max_seconds, deadline)
 
-    TCS = loadTestSuite(input_file)
+    with profiling.phase(profiler, profiling.LOAD):
+        TCS = loadTestSuite(input_file)
     TS = OrderedDict(sorted(TCS.items(), key=lambda t: -len(t[1])))
 
     # budget B modification
@@ -87,32 +94,50 @@ def ga(input_file, B=0):
 
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
 
-    while len(U) > 0:
-        if len(Cg) == maxC:
-            Cg = set()
-        s = select(TS, U, Cg)
-        P.append(s)
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            # stop cleanly at the deadline
+            if profiling.expired(deadline):
+                break
+
+            if len(Cg) == maxC:
+                Cg = set()
+            s = select(TS, U, Cg)
+            P.append(s)
+            yield s
+
+            # select budget B
+            if len(P) >= B+1:
+                break
+
+            Cg = Cg | U[s]
+            del U[s]
+
 
-        # select budget B
-        if len(P) >= B+1:
-            break
+# GREEDY SET COVER (ADDITIONAL): all the test cases selected within budget B
+def ga(input_file, B=0, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-        Cg = Cg | U[s]
-        del U[s]
+    P = list(gaStream(input_file, B, profiler=profiler))
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, P[1:]
+    return profiling.reduction(profiler, 0.0, ptime, P)
 
 
-def ga_multi(input_files, B=0):
+def ga_multi(input_files, B=0, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
 
-    ptime_start = time.clock()
+    ptime_start = time.perf_counter()
 
     # TCS = loadTestSuite(input_file)
 
     #read in coverage information
-    cov_infos = [loadTestSuite(i) for i in input_files]
+    with profiler.phase(profiling.LOAD):
+        cov_infos = [loadTestSuite(i) for i in input_files]
 
     #sort by the length of coveraged number
     cov_infos =  [OrderedDict(sorted(TCS.items(), key=lambda t: -len(t[1]))) for TCS in cov_infos]
@@ -140,44 +165,45 @@ def ga_multi(input_files, B=0):
     cov_mean = [mean(i) for i in cov_len]
     #print(f"std: {cov_std} mean:{cov_mean}")
 
-    while len(cov_infos_left[0]) > 0:
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(cov_infos_left[0]) > 0:
 
-        for i in range(cov_type_num):
-            if cg[i] == maxC[i]:
-                #all covered, start a new record
-                cg[i] = set()
-
-        #find test that gives maximum additional coverage
-        s, uncs_s = 0, float('-inf')
-        for ui in cov_infos_left[0]:
-            total_score = 0
             for i in range(cov_type_num):
-                # length of additional coverage
-                score = len(cov_infos[i][ui] - cg[i])
-                #normalize
-                score = (score - cov_mean[i])/cov_std[i]
-                total_score += score
-            if total_score > uncs_s:
-                s, uncs_s = ui, total_score
-        reduced_tests.append(s)
-
-        # select budget B
-        if len(reduced_tests) >= B:
-            break
+                if cg[i] == maxC[i]:
+                    #all covered, start a new record
+                    cg[i] = set()
+
+            #find test that gives maximum additional coverage
+            s, uncs_s = 0, float('-inf')
+            for ui in cov_infos_left[0]:
+                total_score = 0
+                for i in range(cov_type_num):
+                    # length of additional coverage
+                    score = len(cov_infos[i][ui] - cg[i])
+                    #normalize
+                    score = (score - cov_mean[i])/cov_std[i]
+                    total_score += score
+                if total_score > uncs_s:
+                    s, uncs_s = ui, total_score
+            reduced_tests.append(s)
+
+            # select budget B
+            if len(reduced_tests) >= B:
+                break
 
-        for i in range(cov_type_num):
-            #update coverage
-            cg[i] = cg[i] | cov_infos_left[i][s]
-            del cov_infos_left[i][s]
+            for i in range(cov_type_num):
+                #update coverage
+                cg[i] = cg[i] | cov_infos_left[i][s]
+                del cov_infos_left[i][s]
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, reduced_tests
+    return profiling.reduction(profiler, 0.0, ptime, reduced_tests)
 
 
 
 # GREEDY SET COVER (ADDITIONAL and ADEQUATE)
-def gaAdequacy(input_file):
+def gaAdequacy(input_file, profiler=None):
     def select(TS, U, Cg):
         s, uncs_s = 0, -1
         for ui in U:
@@ -186,9 +212,12 @@ def gaAdequacy(input_file):
                 s, uncs_s = ui, uncs
         return s
 
-    ptime_start = time.clock()
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-    TCS = loadTestSuite(input_file)
+    with profiler.phase(profiling.LOAD):
+        TCS = loadTestSuite(input_file)
     #sort by the length of coveraged number
     TS = OrderedDict(sorted(TCS.items(), key=lambda t: -len(t[1])))
 
@@ -204,27 +233,30 @@ def gaAdequacy(input_file):
     #length of maximum coverage
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
 
-    while len(U) > 0:
-        #all covered
-        if len(Cg) == maxC:
-            break
-        #find test that gives maximum additional coverage
-        s = select(TS, U, Cg)
-        P.append(s)
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            #all covered
+            if len(Cg) == maxC:
+                break
+            #find test that gives maximum additional coverage
+            s = select(TS, U, Cg)
+            P.append(s)
 
-        Cg = Cg | U[s]
-        del U[s]
+            Cg = Cg | U[s]
+            del U[s]
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, P[1:]
+    return profiling.reduction(profiler, 0.0, ptime, P[1:])
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 # JIANG (ART-D)
 # dynamic candidate set
-def artd(input_file, B=0):
+# (stream: yields each test case as soon as it is selected)
+def artdStream(input_file, B=0, max_seconds=None, deadline=None,
+               observer=observers.NULL, profiler=None):
     def generate(U):
         C, T = set(), set()
         while True:
@@ -236,25 +268,18 @@ def artd(input_file, B=0):
             C.add(ui)
         return C
 
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = lsh.jDistance(TS[pi], TS[cj])
+    def select(incidence, P, C):
+        C = list(C)
+        D = incidence.distances(C, P)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-        return j
+        return C[int(np.argmax(D.min(axis=1)))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
-    ptime_start = time.clock()
+    deadline = profiling.stopTime(max_seconds, deadline)
 
-    TS = loadTestSuite(input_file)
+    with profiling.phase(profiler, profiling.LOAD):
+        TS = loadTestSuite(input_file)
 
     # budget B modification
     if B == 0:
@@ -264,37 +289,55 @@ def artd(input_file, B=0):
 
     TS[0] = set()
     P = [0]
+    with profiling.phase(profiler, profiling.INDEX):
+        incidence = lsh.IncidenceMatrix(TS)
 
     C = generate(U)
 
-    iteration, total = 0, float(len(U))
-    while len(U) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
+    observer.event(observers.START, len(U))
+    iteration = 0
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            # stop cleanly at the deadline
+            if profiling.expired(deadline):
+                break
+
+            iteration += 1
+            observer.event(observers.ITERATION, iteration)
+
+            if len(C) == 0:
+                C = generate(U)
+            observer.event(observers.CANDIDATES, len(C))
+            observer.event(observers.DISTANCES, len(C) * len(P))
+            s = select(incidence, P, C)
+            P.append(s)
+            observer.event(observers.SELECTED, s)
+            yield s
+
+            # select budget B
+            if len(P) >= B+1:
+                break
+
+            del U[s]
+            C = C - set([s])
 
-        if len(C) == 0:
-            C = generate(U)
-        s = select(TS, P, C)
-        P.append(s)
 
-        # select budget B
-        if len(P) >= B+1:
-            break
+# JIANG (ART-D): all the test cases selected within budget B
+def artd(input_file, B=0, observer=observers.NULL, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-        del U[s]
-        C = C - set([s])
+    P = list(artdStream(input_file, B, observer=observer, profiler=profiler))
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, P[1:]
+    return profiling.reduction(profiler, 0.0, ptime, P)
 
 
 # JIANG (ART-D ADEQUATE)
 # dynamic candidate set
-def artdAdequacy(input_file, B=0):
+def artdAdequacy(input_file, B=0, observer=observers.NULL, profiler=None):
     def generate(U):
         C, T = set(), set()
         while True:
@@ -306,25 +349,20 @@ def artdAdequacy(input_file, B=0):
             C.add(ui)
         return C
 
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = lsh.jDistance(TS[pi], TS[cj])
+    def select(incidence, P, C):
+        C = list(C)
+        D = incidence.distances(C, P)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-        return j
+        return C[int(np.argmax(D.min(axis=1)))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
-    ptime_start = time.clock()
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-    TS = loadTestSuite(input_file)
+    with profiler.phase(profiling.LOAD):
+        TS = loadTestSuite(input_file)
 
     # budget B modification
     if B == 0:
@@ -334,37 +372,41 @@ def artdAdequacy(input_file, B=0):
 
     TS[0] = set()
     P = [0]
+    with profiling.phase(profiler, profiling.INDEX):
+        incidence = lsh.IncidenceMatrix(TS)
 
     Cg = set()
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
     C = generate(U)
 
-    iteration, total = 0, float(len(U))
-    while len(U) > 0:
-        if len(Cg) == maxC:
-            break
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(C) == 0:
-            C = generate(U)
-        s = select(TS, P, C)
-        P.append(s)
-
-        # select budget B
-        if len(P) >= B+1:
-            break
+    observer.event(observers.START, len(U))
+    iteration = 0
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            if len(Cg) == maxC:
+                break
+            iteration += 1
+            observer.event(observers.ITERATION, iteration)
+
+            if len(C) == 0:
+                C = generate(U)
+            observer.event(observers.CANDIDATES, len(C))
+            observer.event(observers.DISTANCES, len(C) * len(P))
+            s = select(incidence, P, C)
+            P.append(s)
+            observer.event(observers.SELECTED, s)
+
+            # select budget B
+            if len(P) >= B+1:
+                break
 
-        Cg = Cg | U[s]
-        del U[s]
-        C = C - set([s])
+            Cg = Cg | U[s]
+            del U[s]
+            C = C - set([s])
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, P[1:]
+    return profiling.reduction(profiler, 0.0, ptime, P[1:])
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -372,7 +414,9 @@ def artdAdequacy(input_file, B=0):
 
 # ZHOU (ART-F)
 # fixed size candidate set + manhattan distance
-def artf(input_file, B=0):
+# (stream: yields each test case as soon as it is selected)
+def artfStream(input_file, B=0, max_seconds=None, deadline=None,
+               observer=observers.NULL, profiler=None):
     def generate(U):
         C = set()
         if len(U) < 10:
@@ -405,9 +449,10 @@ def artf(input_file, B=0):
 
     # # # # # # # # # # # # # # # # # # # # # #
 
-    ptime_start = time.clock()
+    deadline = profiling.stopTime(max_seconds, deadline)
 
-    TS = loadTestSuite(input_file)
+    with profiling.phase(profiler, profiling.LOAD):
+        TS = loadTestSuite(input_file)
 
     # budget B modification
     if B == 0:
@@ -420,34 +465,50 @@ def artf(input_file, B=0):
 
     C = generate(U)
 
-    iteration, total = 0, float(len(U))
-    while len(U) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
+    observer.event(observers.START, len(U))
+    iteration = 0
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            # stop cleanly at the deadline
+            if profiling.expired(deadline):
+                break
 
-        if len(C) == 0:
-            C = generate(U)
-        s = select(TS, P, C)
-        P.append(s)
+            iteration += 1
+            observer.event(observers.ITERATION, iteration)
+
+            if len(C) == 0:
+                C = generate(U)
+            observer.event(observers.CANDIDATES, len(C))
+            observer.event(observers.DISTANCES, len(C) * len(P))
+            s = select(TS, P, C)
+            P.append(s)
+            observer.event(observers.SELECTED, s)
+            yield s
+
+            # select budget B
+            if len(P) >= B+1:
+                break
 
-        # select budget B
-        if len(P) >= B+1:
-            break
+            del U[s]
+            C = C - set([s])
 
-        del U[s]
-        C = C - set([s])
 
-    ptime = time.clock() - ptime_start
+# ZHOU (ART-F): all the test cases selected within budget B
+def artf(input_file, B=0, observer=observers.NULL, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-    return 0.0, ptime, P[1:]
+    P = list(artfStream(input_file, B, observer=observer, profiler=profiler))
+
+    ptime = time.perf_counter() - ptime_start
+
+    return profiling.reduction(profiler, 0.0, ptime, P)
 
 
 # ZHOU (ART-F ADEQUATE)
 # fixed size candidate set + manhattan distance
-def artfAdequacy(input_file, B=0):
+def artfAdequacy(input_file, B=0, observer=observers.NULL, profiler=None):
     def generate(U):
         C = set()
         if len(U) < 10:
@@ -480,9 +541,12 @@ def artfAdequacy(input_file, B=0):
 
     # # # # # # # # # # # # # # # # # # # # # #
 
-    ptime_start = time.clock()
+    if profiler is None:
+        profiler = profiling.Profiler()
+    ptime_start = time.perf_counter()
 
-    TS = loadTestSuite(input_file)
+    with profiler.phase(profiling.LOAD):
+        TS = loadTestSuite(input_file)
 
     # budget B modification
     if B == 0:
@@ -497,30 +561,32 @@ def artfAdequacy(input_file, B=0):
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
     C = generate(U)
 
-    iteration, total = 0, float(len(U))
-    while len(U) > 0:
-        if len(Cg) == maxC:
-            break
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(C) == 0:
-            C = generate(U)
-        s = select(TS, P, C)
-        P.append(s)
-
-        # select budget B
-        if len(P) >= B+1:
-            break
+    observer.event(observers.START, len(U))
+    iteration = 0
+    with profiling.phase(profiler, profiling.SELECT):
+        while len(U) > 0:
+            if len(Cg) == maxC:
+                break
+            iteration += 1
+            observer.event(observers.ITERATION, iteration)
+
+            if len(C) == 0:
+                C = generate(U)
+            observer.event(observers.CANDIDATES, len(C))
+            observer.event(observers.DISTANCES, len(C) * len(P))
+            s = select(TS, P, C)
+            P.append(s)
+            observer.event(observers.SELECTED, s)
+
+            # select budget B
+            if len(P) >= B+1:
+                break
 
-        Cg = Cg | U[s]
-        del U[s]
-        C = C - set([s])
+            Cg = Cg | U[s]
+            del U[s]
+            C = C - set([s])
 
-    ptime = time.clock() - ptime_start
+    ptime = time.perf_counter() - ptime_start
 
-    return 0.0, ptime, P[1:]
+    return profiling.reduction(profiler, 0.0, ptime, P[1:])
 
@@ -0,0 +1,201 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import fastr
+import inputs
+import profiling
+
+"""
+This file collapses the duplicated test cases of a test suite before reduction.
+Test cases with the same content (bbox line, or set of covered entities) are
+grouped by content hash, the reduction algorithm runs on one representative per
+group, and its selection is mapped back to the IDs of the original test suite
+according to a duplicate policy:
+  FIRST: the first test case of each selected group
+  RANDOM: a random test case of each selected group
+  ALL: all the test cases of each selected group (one after the other)
+"""
+
+FIRST = "first"
+RANDOM = "random"
+ALL = "all"
+POLICIES = (FIRST, RANDOM, ALL)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# content of a test case (a line of the input file) compared for duplicates
+def testCaseContent(line, coverage=False):
+    line = line.rstrip("\n")
+    if coverage:
+        # coverage test cases are sets of covered entities
+        line = " ".join(sorted(set(line.split())))
+    return line.encode()
+
+# group the test cases of inputFile by content and store one per group
+def storeUnique(inputFile, uniqueFile, coverage=False):
+    """INPUT
+    (str)inputFile: test suite (one test case per line)
+    (str)uniqueFile: where to store the representatives (one per group)
+    (bool)coverage: True if the lines are coverage sets (GA, ART)
+
+    OUTPUT
+    (list)groups: groups[i] are the IDs (in inputFile) of the test cases
+    with the same content as test case i+1 of uniqueFile"""
+    groups, groupOf = [], {}
+    with inputs.openInput(inputFile) as fin, open(uniqueFile, "w") as fout:
+        for tcID, line in enumerate(fin, 1):
+            key = hashlib.blake2b(testCaseContent(line, coverage),
+                                  digest_size=16).digest()
+            group = groupOf.get(key)
+            if group is None:
+                groupOf[key] = len(groups)
+                groups.append([tcID])
+                fout.write(line if line.endswith("\n") else line + "\n")
+            else:
+                groups[group].append(tcID)
+    return groups
+
+# map a selection of representatives to the IDs of the original test suite
+def expand(selection, groups, policy=FIRST, B=0):
+    """INPUT
+    (list)selection: selected test cases of the unique test suite
+    (list)groups: groups of duplicates (see storeUnique)
+    (str)policy: FIRST, RANDOM or ALL
+    (int)B: budget, the ALL expansion is cut after B test cases (0: no cut)
+
+    OUTPUT
+    (list)selection: selected test cases of the original test suite"""
+    if policy == FIRST:
+        return [groups[tc - 1][0] for tc in selection]
+    if policy == RANDOM:
+        return [random.choice(groups[tc - 1]) for tc in selection]
+    if policy == ALL:
+        expanded = [dup for tc in selection for dup in groups[tc - 1]]
+        return expanded[:B] if B > 0 else expanded
+    raise ValueError("unknown duplicate policy: {}".format(policy))
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# run algorithm on the unique test cases of inputFile
+# Returns: collapse time, groups of duplicates, output of algorithm
+def runUnique(algorithm, inputFile, args, kwargs, coverage=False):
+    profiler = kwargs.setdefault("profiler", profiling.Profiler())
+    tmpDir = tempfile.mkdtemp(prefix="fastr-unique-")
+    try:
+        uniqueFile = os.path.join(tmpDir, os.path.basename(inputFile))
+        t0 = time.perf_counter()
+        with profiler.phase(profiling.LOAD):
+            groups = storeUnique(inputFile, uniqueFile, coverage)
+        dTime = time.perf_counter() - t0
+        result = algorithm(uniqueFile, *args, **kwargs)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return dTime, groups, result
+
+# reduce the test suite running algorithm on its unique test cases only
+def collapsed(algorithm, inputFile, *args, policy=FIRST, coverage=False, B=0,
+              **kwargs):
+    """INPUT
+    (function)algorithm: reducer called as algorithm(inputFile, *args,
+    **kwargs), returning a tuple that ends with the selection
+    (str)inputFile: test suite
+    (str)policy: duplicate policy (FIRST, RANDOM or ALL)
+    (bool)coverage: True if inputFile is a coverage file (GA, ART)
+    (int)B: budget, passed to algorithm if positive
+    args, kwargs: other parameters of algorithm
+
+    OUTPUT
+    (Reduction)result: output of algorithm with the selection mapped back to
+    the original test suite (the collapse time is added to its first time)"""
+    if policy not in POLICIES:
+        raise ValueError("unknown duplicate policy: {}".format(policy))
+    if B > 0:
+        kwargs["B"] = B
+    dTime, groups, result = runUnique(algorithm, inputFile, args, kwargs,
+                                      coverage)
+
+    selection = expand(result[-1], groups, policy, B)
+    collapsedResult = result._make(
+        (result[0] + dTime,) + tuple(result[1:-1]) + (selection,))
+    collapsedResult.profiler = result.profiler
+    return collapsedResult
+
+# full prioritization running algorithm on the unique test cases only
+def prioritize(algorithm, inputFile, *args, policy=FIRST, **kwargs):
+    """INPUT
+    (function)algorithm: fastPlusPlus, fastCS, fast_pw or fast_
+    (str)inputFile: test suite
+    (str)policy: duplicate policy (FIRST, RANDOM or ALL)
+    args, kwargs: other parameters of algorithm (except B)
+
+    OUTPUT
+    (Prioritization)prioritization: answers each budget with a prefix
+    (see fastr.prioritize), duplicates share the time of their group"""
+    if policy not in POLICIES:
+        raise ValueError("unknown duplicate policy: {}".format(policy))
+    stamps = []
+    kwargs.update(B=0, stamps=stamps)
+    dTime, groups, result = runUnique(algorithm, inputFile, args, kwargs)
+
+    expanded, expandedStamps = [], []
+    for tc, stamp in zip(result.selection, stamps):
+        dups = expand([tc], groups, policy)
+        expanded.extend(dups)
+        expandedStamps.extend([stamp] * len(dups))
+    return fastr.Prioritization(result.pTime + dTime, expanded, expandedStamps,
+                                result.profiler)
+
+
+usage = """USAGE: python3 py/dedup.py <inputFile> <coverage>
+Report the duplicated test cases of a test suite.
+OPTIONS:
+  <inputFile>: the test suite, e.g. input/flex_v3/flex-bbox.txt
+  <coverage>: True for coverage files (lines are sets), False for bbox files"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(usage)
+        exit()
+
+    script, inputFile, coverage = sys.argv
+    coverage = coverage == "True"
+
+    tmpDir = tempfile.mkdtemp(prefix="fastr-unique-")
+    try:
+        groups = storeUnique(inputFile, os.path.join(tmpDir, "unique.txt"),
+                             coverage)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+    N = sum(len(dups) for dups in groups)
+    largest = max(groups, key=len) if groups else []
+    print("Test cases: {}".format(N))
+    print("Unique test cases: {} ({}%)".format(
+        len(groups), round(100.0 * len(groups) / max(N, 1), 2)))
+    print("Duplicated groups: {}".format(
+        sum(1 for dups in groups if len(dups) > 1)))
+    print("Largest group: {} test cases (e.g. {})".format(
+        len(largest), largest[:10]))
@@ -115,7 +115,7 @@ if __name__ == "__main__":
 
 
     for run in range(repeats):
-        sTime, cTime, pTime, sel = fastr_adequate.fast_(inputFile, wBoxFile, all_, r=r, b=b, bbox=True, k=k, memory=True)
+        pTime, cTime, rTime, sel = fastr_adequate.fast_(inputFile, wBoxFile, all_, r=r, b=b, bbox=True, k=k, memory=True)
         fdl = metric.fdl(sel, faultMatrix, javaFlag)
         tsr = metric.tsr(sel, inputFile)
         sOut = "{}/{}-{}.pickle".format(sPath, "FAST-all", run+1)
@@ -83,11 +83,19 @@ if __name__ == "__main__":
 
     numOfTCS = sum((1 for _ in open(inputFile)))
 
+    # FAST-R: one full prioritization per run, each budget is a prefix
+    prioritizations = {"FAST++": [], "FAST-CS": [], "FAST-pw": [], "FAST-all": []}
+    for run in range(repeats):
+        prioritizations["FAST++"].append(fastr.prioritize(fastr.fastPlusPlus, inputFile, dim=dim))
+        prioritizations["FAST-CS"].append(fastr.prioritize(fastr.fastCS, inputFile, dim=dim))
+        prioritizations["FAST-pw"].append(fastr.prioritize(fastr.fast_pw, inputFile, r, b, bbox=True, k=k, memory=True))
+        prioritizations["FAST-all"].append(fastr.prioritize(fastr.fast_, inputFile, all_, r=r, b=b, bbox=True, k=k, memory=True))
+
     for reduction in range(1, repetitions+1):
         B = int(numOfTCS * reduction / 100)
 
         for run in range(repeats):
-            pTime, rTime, sel = fastr.fastPlusPlus(inputFile, dim=dim, B=B)
+            pTime, rTime, sel = prioritizations["FAST++"][run].budget(B)
             fdl = metric.fdl(sel, faultMatrix, javaFlag)
             sOut = "{}/{}-{}-{}.pickle".format(sPath, "FAST++", reduction, run+1)
             pickle.dump(sel, open(sOut, "wb"))
@@ -96,7 +104,7 @@ if __name__ == "__main__":
             print("FAST++", reduction, pTime, rTime, fdl)
 
         for run in range(repeats):
-            pTime, rTime, sel = fastr.fastCS(inputFile, dim=dim, B=B)
+            pTime, rTime, sel = prioritizations["FAST-CS"][run].budget(B)
             fdl = metric.fdl(sel, faultMatrix, javaFlag)
             sOut = "{}/{}-{}-{}.pickle".format(sPath, "FAST-CS", reduction, run+1)
             pickle.dump(sel, open(sOut, "wb"))
@@ -106,7 +114,7 @@ if __name__ == "__main__":
 
 
         for run in range(repeats):
-            pTime, rTime, sel = fastr.fast_pw(inputFile, r, b, bbox=True, k=k, memory=True, B=B)
+            pTime, rTime, sel = prioritizations["FAST-pw"][run].budget(B)
             fdl = metric.fdl(sel, faultMatrix, javaFlag)
             sOut = "{}/{}-{}-{}.pickle".format(sPath, "FAST-pw", reduction, run+1)
             pickle.dump(sel, open(sOut, "wb"))
@@ -116,7 +124,7 @@ if __name__ == "__main__":
 
 
         for run in range(repeats):
-            pTime, rTime, sel = fastr.fast_(inputFile, all_, r=r, b=b, bbox=True, k=k, memory=True, B=B)
+            pTime, rTime, sel = prioritizations["FAST-all"][run].budget(B)
             fdl = metric.fdl(sel, faultMatrix, javaFlag)
             sOut = "{}/{}-{}-{}.pickle".format(sPath, "FAST-all", reduction, run+1)
             pickle.dump(sel, open(sOut, "wb"))
@@ -19,6 +19,8 @@ import pickle
 import sys
 
 import fastr
+import observers
+import preparation
 
 """
 This file runs all FAST-R algorithms (fastr_adequate.py) and the competitors (competitors.py)
@@ -61,18 +63,22 @@ if __name__ == "__main__":
     def log_(x): return int(math.log(x)) + 1
     def one_(x): return 1
 
+    # read from the split gzip parts (scalability-bbox.txt.gz_*) unless it has
+    # been decompressed (see inputs)
     inputFile = "input/scalability/scalability-bbox.txt"
 
     outpath = "outputLargeScale/"
     sPath = outpath + "selections/"
     tPath = outpath + "measures/"
 
-    numOfTCS = sum((1 for _ in open(inputFile)))
+    numOfTCS = preparation.countTestCases(inputFile)
 
     if alg == "FAST++":
+        # one full prioritization, each budget is a prefix
+        prioritization = fastr.prioritize(fastr.fastPlusPlus, inputFile, dim=dim, memory=False)
         for reduction in range(repetitions):
             B = int(numOfTCS * reduction / 100)
-            pTime, rTime, sel = fastr.fastPlusPlus(inputFile, dim=dim, B=B, memory=False)
+            pTime, rTime, sel = prioritization.budget(B)
             sOut = "{}/{}-{}.pickle".format(sPath, "FAST++", reduction+1)
             pickle.dump(sel, open(sOut, "wb"))
             tOut = "{}/{}-{}.pickle".format(tPath, "FAST++", reduction+1)
@@ -81,9 +87,11 @@ if __name__ == "__main__":
 
 
     if alg == "FAST-CS":
+        # one full prioritization, each budget is a prefix
+        prioritization = fastr.prioritize(fastr.fastCS, inputFile, dim=dim, memory=False)
         for reduction in range(repetitions):
             B = int(numOfTCS * reduction / 100)
-            pTime, rTime, sel = fastr.fastCS(inputFile, dim=dim, B=B, memory=False)
+            pTime, rTime, sel = prioritization.budget(B)
             sOut = "{}/{}-{}.pickle".format(sPath, "FAST-CS", reduction+1)
             pickle.dump(sel, open(sOut, "wb"))
             tOut = "{}/{}-{}.pickle".format(tPath, "FAST-CS", reduction+1)
@@ -92,9 +100,12 @@ if __name__ == "__main__":
 
 
     if alg == "FAST-pw":
+        # one full prioritization, each budget is a prefix
+        prioritization = fastr.prioritize(fastr.fast_pw, inputFile, r, b, bbox=True, k=k, memory=False,
+                                          observer=observers.Progress())
         for reduction in range(repetitions):
             B = int(numOfTCS * reduction / 100)
-            pTime, rTime, sel = fastr.fast_pw(inputFile, r, b, bbox=True, k=k, memory=False, B=B)
+            pTime, rTime, sel = prioritization.budget(B)
             sOut = "{}/{}-{}.pickle".format(sPath, "FAST-pw", reduction+1)
             pickle.dump(sel, open(sOut, "wb"))
             tOut = "{}/{}-{}.pickle".format(tPath, "FAST-pw", reduction+1)
@@ -103,10 +114,13 @@ if __name__ == "__main__":
 
 
     if alg == "FAST-all":
+        # one full prioritization, each budget is a prefix
+        prioritization = fastr.prioritize(
+            fastr.fast_, inputFile, all_, r, b, bbox=True, k=k, memory=False,
+            observer=observers.Progress())
         for reduction in range(repetitions):
             B = int(numOfTCS * reduction / 100)
-            pTime, rTime, sel = fastr.fast_(
-                inputFile, all_, r, b, bbox=True, k=k, memory=False, B=B)
+            pTime, rTime, sel = prioritization.budget(B)
             sOut = "{}/{}-{}.pickle".format(sPath, "FAST-all", reduction+1)
             pickle.dump(sel, open(sOut, "wb"))
             tOut = "{}/{}-{}.pickle".format(tPath, "FAST-all", reduction+1)
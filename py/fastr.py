@@ -15,21 +15,16 @@ along with this source.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections import defaultdict
 from collections import OrderedDict
-import math
-import os
-import pickle
 import random
-import sys
 import time
 
-from functools import reduce
 import numpy as np
 
-from sklearn.feature_extraction.text import HashingVectorizer
-from sklearn.random_projection import johnson_lindenstrauss_min_dim
-from sklearn.random_projection import SparseRandomProjection
-
+import inputs
 import lsh
+import observers
+import preparation
+import profiling
 
 
 """
@@ -41,464 +36,398 @@ This file implements FAST-R test suite reduction algorithms.
 # utility function to load test suite
 def loadTestSuite(input_file, bbox=False, k=5):
     TS = defaultdict()
-    with open(input_file) as fin:
+    with inputs.openInput(input_file) as fin:
         tcID = 1
         for tc in fin:
             if bbox:
-                TS[tcID] = tc[:-1]
+                # shingled while the next test cases are read
+                TS[tcID] = lsh.rollingShingles(tc[:-1], k)
             else:
                 TS[tcID] = set(tc[:-1].split())
             tcID += 1
+    if bbox:
+        return OrderedDict(TS)
     shuffled = list(TS.keys())
     random.shuffle(shuffled)
     newTS = OrderedDict()
     for key in shuffled:
         newTS[key] = TS[key]
-    if bbox:
-        newTS = lsh.kShingles(TS, k)
     return newTS
 
-# store signatures on disk for future re-use
-def storeSignatures(input_file, sigfile, hashes, bbox=False, k=5):
-    with open(sigfile, "w") as sigfile:
-        with open(input_file) as fin:
-            tcID = 1
-            for tc in fin:
-                if bbox:
-                    # shingling
-                    tc_ = tc[:-1]
-                    tc_shingles = set()
-                    for i in range(len(tc_) - k + 1):
-                        tc_shingles.add(hash(tc_[i:i + k]))
-
-                    sig = lsh.tcMinhashing((tcID, set(tc_shingles)), hashes)
-                else:
-                    tc_ = tc[:-1].split()
-                    sig = lsh.tcMinhashing((tcID, set(tc_)), hashes)
-                for hash_ in sig:
-                    sigfile.write(hash_)
-                    sigfile.write(" ")
-                sigfile.write("\n")
-                tcID += 1
-
-# load stored signatures
-def loadSignatures(input_file):
-    sig = {}
-    start = time.clock()
-    with open(input_file, "r") as fin:
-        tcID = 1
-        for tc in fin:
-            sig[tcID] = [i.strip() for i in tc[:-1].split()]
-            tcID += 1
-    return sig, time.clock() - start
-
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
-# FAST-PW (pairwise comparison with candidate set)
-def fast_pw(input_file, r, b, bbox=False, k=5, memory=False, B=0):
-    n = r * b  # number of hash functions
-
-    hashes = [lsh.hashFamily(i) for i in range(n)]
-
-    if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
-        # generate minhashes signatures
-        mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
-
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
-        else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
+# FAST-PW selection: yields the test cases as soon as they are prioritized
+def pwSelection(sigs, bucket, B=0, deadline=None, observer=observers.NULL):
+    n = sigs.n
+    pool = lsh.CandidatePool(len(sigs))
 
     # budget B modification
     if B == 0:
-        B = len(tcs)
-
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
-
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
+        B = len(pool)
 
-    prioritized_tcs = [0]
+    if profiling.expired(deadline) or B <= 0:
+        return
 
     # First TC
 
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-    tcs -= set([first_tc])
-    del tcs_minhashes[first_tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while len(tcs_minhashes) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
-
-        selected_tc, max_dist = random.choice(tuple(candidates)), -1
-        for candidate in tcs_minhashes:
-            if candidate in candidates:
-                dist = lsh.jDistanceEstimate(
-                    selected_tcs_minhash, tcs_minhashes[candidate])
-                if dist > max_dist:
-                    selected_tc, max_dist = candidate, dist
-
-        for i in range(n):
-            if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
-
-        prioritized_tcs.append(selected_tc)
-
-        # select budget B
-        if len(prioritized_tcs) >= B+1:
+    selected_tcs_minhash = lsh.emptySignature(n)
+    first_tc = random.choice(sigs.tcIDs)
+    row = sigs.rows[first_tc]
+    sigs.merge(selected_tcs_minhash, [row])
+    observer.event(observers.SELECTED, first_tc)
+    yield first_tc
+    selected = 1
+    pool.remove(row)
+    bucket.remove(first_tc)
+
+    observer.event(observers.START, len(pool))
+    iteration = 0
+    while len(pool) > 0:
+        # select budget B (or stop at the deadline)
+        if selected >= B or profiling.expired(deadline):
             break
 
-        tcs -= set([selected_tc])
-        del tcs_minhashes[selected_tc]
+        iteration += 1
+        observer.event(observers.ITERATION, iteration)
 
-    ptime = time.clock() - ptime_start
+        # candidates: test cases not selected and not in the LSH hits
+        pool.flag(bucket.candidateRows(selected_tcs_minhash))
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, ptime, prioritized_tcs[1:max_ts_size]
+        if pool.candidateCount() == 0:
+            observer.event(observers.RESET)
+            selected_tcs_minhash = lsh.emptySignature(n)
+            pool.flag(bucket.candidateRows(selected_tcs_minhash))
+            if pool.candidateCount() == 0:
+                pool.flag()
 
+        count = pool.candidateCount()
+        observer.event(observers.SIMILAR, len(pool) - count)
+        observer.event(observers.CANDIDATES, count)
 
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+        observer.event(observers.DISTANCES, count)
+        row, max_dist = sigs.farthest(selected_tcs_minhash, pool.candidates())
+        selected_tc = sigs.tcIDs[row]
 
-# FAST-f (for any input function f, i.e., size of candidate set)
-def fast_(input_file, selsize, r, b, bbox=False, k=5, memory=False, B=0):
-    n = r * b  # number of hash functions
-
-    hashes = [lsh.hashFamily(i) for i in range(n)]
-
-    if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
-        # generate minhashes signatures
-        mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
-
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
-        else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
+        sigs.merge(selected_tcs_minhash, [row])
 
-    # budget B modification
-    if B == 0:
-        B = len(tcs)
+        observer.event(observers.SELECTED, selected_tc)
+        yield selected_tc
+        selected += 1
 
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
+        pool.remove(row)
+        bucket.remove(selected_tc)
 
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
+# FAST-PW (pairwise comparison with candidate set)
+def fast_pw(input_file, r, b, bbox=False, k=5, memory=False, B=0,
+            profile=None, workers=1, bits=0, oph=False, stamps=None,
+            observer=observers.NULL, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    mh_time, ptime_start, sigs, bucket = preparation.lshSetup(
+        input_file, r, b, bbox, k, memory, profile, workers, bits, oph,
+        observer, profiler)
 
     prioritized_tcs = [0]
+    with profiler.phase(profiling.SELECT):
+        for selected_tc in pwSelection(sigs, bucket, B, observer=observer):
+            prioritized_tcs.append(selected_tc)
+            if stamps is not None:
+                stamps.append(time.perf_counter() - ptime_start)
 
-    # First TC
+    ptime = time.perf_counter() - ptime_start
 
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-    tcs -= set([first_tc])
-    del tcs_minhashes[first_tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while len(tcs_minhashes) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
-
-        to_sel = min(selsize(len(candidates)), len(candidates))
-        selected_tc_set = random.sample(tuple(candidates), to_sel)
-
-        for selected_tc in selected_tc_set:
-            for i in range(n):
-                if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                    selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
+    max_ts_size = len(sigs)
+    return profiling.reduction(profiler, mh_time, ptime,
+                               prioritized_tcs[1:max_ts_size])
 
-            prioritized_tcs.append(selected_tc)
+# FAST-PW as a stream: test cases are yielded as soon as they are selected,
+# and the selection stops cleanly after max_seconds or at the deadline
+def fast_pwStream(input_file, r, b, bbox=False, k=5, memory=False, B=0,
+                  profile=None, workers=1, bits=0, oph=False,
+                  max_seconds=None, deadline=None, observer=observers.NULL,
+                  profiler=None):
+    deadline = profiling.stopTime(max_seconds, deadline)
+    mh_time, ptime_start, sigs, bucket = preparation.lshSetup(
+        input_file, r, b, bbox, k, memory, profile, workers, bits, oph,
+        observer, profiler)
+    with profiling.phase(profiler, profiling.SELECT):
+        yield from pwSelection(sigs, bucket, B, deadline, observer)
 
-            # select budget B
-            if len(prioritized_tcs) >= B+1:
-                break
 
-            tcs -= set([selected_tc])
-            del tcs_minhashes[selected_tc]
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-        # select budget B
-        if len(prioritized_tcs) >= B+1:
-            break
+# FAST-f selection: yields the test cases as soon as they are prioritized
+def fSelection(sigs, bucket, selsize, B=0, deadline=None,
+               observer=observers.NULL):
+    n = sigs.n
+    pool = lsh.CandidatePool(len(sigs))
+
+    # budget B modification
+    if B == 0:
+        B = len(pool)
 
-    ptime = time.clock() - ptime_start
+    if profiling.expired(deadline) or B <= 0:
+        return
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, ptime, prioritized_tcs[1:max_ts_size]
+    # First TC
 
+    selected_tcs_minhash = lsh.emptySignature(n)
+    first_tc = random.choice(sigs.tcIDs)
+    row = sigs.rows[first_tc]
+    sigs.merge(selected_tcs_minhash, [row])
+    observer.event(observers.SELECTED, first_tc)
+    yield first_tc
+    selected = 1
+    pool.remove(row)
+    bucket.remove(first_tc)
+
+    observer.event(observers.START, len(pool))
+    iteration = 0
+    while len(pool) > 0:
+        iteration += 1
+        observer.event(observers.ITERATION, iteration)
 
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-# Preparation + utils
+        # candidates: test cases not selected and not in the LSH hits
+        pool.flag(bucket.candidateRows(selected_tcs_minhash))
 
-# compute euclidean distance
-def euclideanDist(v, w):
-    d = 0
+        if pool.candidateCount() == 0:
+            observer.event(observers.RESET)
+            selected_tcs_minhash = lsh.emptySignature(n)
+            pool.flag(bucket.candidateRows(selected_tcs_minhash))
+            if pool.candidateCount() == 0:
+                pool.flag()
 
-    for k in v.keys():
-        if k not in w.keys():
-            d += v[k] ** 2
-        else:
-            d += (v[k] - w[k]) ** 2
+        count = pool.candidateCount()
+        observer.event(observers.SIMILAR, len(pool) - count)
+        observer.event(observers.CANDIDATES, count)
+        to_sel = min(selsize(count), count)
 
-    for k in w.keys():
-        if k not in v.keys():
-            d += w[k] ** 2
+        for row in pool.sample(to_sel):
+            # select budget B (or stop at the deadline)
+            if selected >= B or profiling.expired(deadline):
+                return
 
-    return math.sqrt(d)
+            selected_tc = sigs.tcIDs[row]
+            sigs.merge(selected_tcs_minhash, [row])
 
-# Preparation phase for FAST++ and FAST-CS
-def preparation(inputFile, dim=0):
-    vectorizer = HashingVectorizer()  # compute "TF"
-    testCases = [line.rstrip("\n") for line in open(inputFile)]
-    testSuite = vectorizer.fit_transform(testCases)
+            observer.event(observers.SELECTED, selected_tc)
+            yield selected_tc
+            selected += 1
 
-    # dimensionality reduction
-    if dim <= 0:
-        e = 0.5  # epsilon in jl lemma
-        dim = johnson_lindenstrauss_min_dim(len(testCases), eps=e)
-    srp = SparseRandomProjection(n_components=dim)
-    projectedTestSuite = srp.fit_transform(testSuite)
+            pool.remove(row)
+            bucket.remove(selected_tc)
 
-    # map sparse matrix to dict
-    TS = []
-    for i in range(len(testCases)):
-        tc = {}
-        for j in projectedTestSuite[i].nonzero()[1]:
-            tc[j] = projectedTestSuite[i, j]
-        TS.append(tc)
+# FAST-f (for any input function f, i.e., size of candidate set)
+# (no b-bit mode: FAST-f samples its candidates, it never scores them)
+def fast_(input_file, selsize, r, b, bbox=False, k=5, memory=False, B=0,
+          profile=None, workers=1, oph=False, stamps=None,
+          observer=observers.NULL, profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    mh_time, ptime_start, sigs, bucket = preparation.lshSetup(
+        input_file, r, b, bbox, k, memory, profile, workers, oph=oph,
+        observer=observer, profiler=profiler)
 
-    return TS
+    prioritized_tcs = [0]
+    with profiler.phase(profiling.SELECT):
+        for selected_tc in fSelection(sigs, bucket, selsize, B,
+                                      observer=observer):
+            prioritized_tcs.append(selected_tc)
+            if stamps is not None:
+                stamps.append(time.perf_counter() - ptime_start)
+
+    ptime = time.perf_counter() - ptime_start
+
+    max_ts_size = len(sigs)
+    return profiling.reduction(profiler, mh_time, ptime,
+                               prioritized_tcs[1:max_ts_size])
+
+# FAST-f as a stream: test cases are yielded as soon as they are selected,
+# and the selection stops cleanly after max_seconds or at the deadline
+def fast_Stream(input_file, selsize, r, b, bbox=False, k=5, memory=False, B=0,
+                profile=None, workers=1, oph=False,
+                max_seconds=None, deadline=None, observer=observers.NULL,
+                profiler=None):
+    deadline = profiling.stopTime(max_seconds, deadline)
+    mh_time, ptime_start, sigs, bucket = preparation.lshSetup(
+        input_file, r, b, bbox, k, memory, profile, workers, oph=oph,
+        observer=observer, profiler=profiler)
+    with profiling.phase(profiler, profiling.SELECT):
+        yield from fSelection(sigs, bucket, selsize, B, deadline, observer)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-# FAST++ Reduction phase
-def reductionPlusPlus(TS, B):
+# FAST++ selection: yields the test cases as soon as they are selected
+def plusPlusSelection(TS, B, deadline=None):
+    TS = preparation.asMatrix(TS)
+    N = TS.shape[0]
+    norms = preparation.sqNorms(TS)
     reducedTS = []
+    if profiling.expired(deadline) or B <= 0:
+        return
 
-    # distance to closest center
-    D = defaultdict(lambda:float('Inf'))
+    # squared distance to closest center
+    D = np.full(N, np.inf)
     # select first center randomly
-    selectedTC = random.randint(0, len(TS)-1)
+    selectedTC = random.randint(0, N-1)
     reducedTS.append(selectedTC + 1)
     D[selectedTC] = 0
+    yield selectedTC + 1
 
-    while len(reducedTS) < B:
+    while len(reducedTS) < B and not profiling.expired(deadline):
         # k-means++ tc reductionCS
-        norm = 0
-        for tc in range(len(TS)):
-            if D[tc] != 0:
-                dist = euclideanDist(TS[tc], TS[selectedTC])
-                dist *= dist
-                if dist < D[tc]:
-                    D[tc] = dist
-            norm += D[tc]
+        # (selected and duplicate test cases stay at distance 0)
+        np.minimum(D, preparation.sqDistances(TS, selectedTC, norms), out=D)
+        cum = np.cumsum(D)
 
         # safe exit point (if all distances are 0)
         # (but not all test cases have been selected)
-        if norm == 0:
-            extraTCS = list(set(range(1, len(TS)+1)) - set(reducedTS))
+        if cum[-1] == 0:
+            extraTCS = list(set(range(1, N+1)) - set(reducedTS))
             random.shuffle(extraTCS)
-            reducedTS.extend(extraTCS[:B-len(reducedTS)])
+            for tc in extraTCS[:B-len(reducedTS)]:
+                if profiling.expired(deadline):
+                    break
+                yield tc
             break
 
+        selectedTC = preparation.proportionalSample(cum)
+        reducedTS.append(selectedTC + 1)
+        D[selectedTC] = 0
+        yield selectedTC + 1
 
-        c = 0
-        coinToss = random.random() * norm
-        for tc, dist in D.items():
-            if coinToss < c + dist:
-                reducedTS.append(tc + 1)
-                D[tc] = 0
-                break
-            c += dist
+# FAST++ Reduction phase
+def reductionPlusPlus(TS, B, stamps=None):
+    start = time.perf_counter()
+    reducedTS = []
+    for tc in plusPlusSelection(TS, B):
+        reducedTS.append(tc)
+        if stamps is not None:
+            stamps.append(time.perf_counter() - start)
 
     return reducedTS
 
 # FAST++ test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
-def fastPlusPlus(inputFile, dim=0, B=0, memory=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+def fastPlusPlus(inputFile, dim=0, B=0, memory=True, seed=None, stamps=None,
+                 profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    pTime, TS = preparation.loadProjection(inputFile, dim=dim, memory=memory,
+                                           seed=seed, profiler=profiler)
 
     if B <= 0:
-        B = len(TS)
+        B = TS.shape[0]
 
-    t2 = time.clock()
-    reducedTS = reductionPlusPlus(TS, B)
-    t3 = time.clock()
+    t2 = time.perf_counter()
+    with profiler.phase(profiling.SELECT):
+        reducedTS = reductionPlusPlus(TS, B, stamps)
+    t3 = time.perf_counter()
     sTime = t3-t2
 
-    return pTime, sTime, reducedTS
+    return profiling.reduction(profiler, pTime, sTime, reducedTS)
+
+# FAST++ as a stream: test cases are yielded as soon as they are selected,
+# and the selection stops cleanly after max_seconds or at the deadline
+def fastPlusPlusStream(inputFile, dim=0, B=0, memory=True, seed=None,
+                       max_seconds=None, deadline=None, profiler=None):
+    deadline = profiling.stopTime(max_seconds, deadline)
+    pTime, TS = preparation.loadProjection(inputFile, dim=dim, memory=memory,
+                                           seed=seed, profiler=profiler)
+    if B <= 0:
+        B = TS.shape[0]
+    with profiling.phase(profiler, profiling.SELECT):
+        yield from plusPlusSelection(TS, B, deadline)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # FAST-CS
 
 # FAST-CS Reduction phase
-def reductionCS(TS, B):
-    reducedTS = []
-
-    # compute center of mass
-    centerOfMass = defaultdict(float)
-    for tc in TS:
-        for k, v in tc.items():
-            centerOfMass[k] += v
-    # normalize
-    for k in centerOfMass.keys():
-        centerOfMass[k] /= len(TS)
-
-    # compute distances
-    D = defaultdict(float)
-    norm = 0
-    for tc in range(len(TS)):
-        dist = euclideanDist(TS[tc], centerOfMass)
-        D[tc] = dist*dist
-        norm += D[tc]
-
-    # compute probabilities of being sampled
-    P = []
-    if norm != 0:
-        p = 1.0 / (2*len(TS))
-        for tc in range(len(TS)):
-            P.append(p + D[tc] / (2*norm))
-    else:
-        P = [1.0 / len(TS)] * len(TS)
-
-    # numeric error: when sum of P != 1
-    P[random.randint(0, len(TS)-1)] += 1.0 - sum(P)
-
+def reductionCS(TS, B, stamps=None):
+    start = time.perf_counter()
     # proportional sampling
-    reducedTS = list(np.random.choice(list(range(1, len(TS)+1)), size=B, p=P, replace=False))
+    order = preparation.weightedOrder(
+        preparation.csWeights(preparation.asMatrix(TS)))
+    reducedTS = (order[:B] + 1).tolist()
+    # the whole order is known at once
+    if stamps is not None:
+        stamps.extend([time.perf_counter() - start] * len(reducedTS))
 
     return reducedTS
 
 # FAST-CS test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
-def fastCS(inputFile, dim=0, B=0, memory=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+def fastCS(inputFile, dim=0, B=0, memory=True, seed=None, stamps=None,
+           profiler=None):
+    if profiler is None:
+        profiler = profiling.Profiler()
+    pTime, TS = preparation.loadProjection(inputFile, dim=dim, memory=memory,
+                                           seed=seed, profiler=profiler)
 
     if B <= 0:
-        B = len(TS)
+        B = TS.shape[0]
 
-    t2 = time.clock()
-    reducedTS = reductionCS(TS, B)
-    t3 = time.clock()
+    t2 = time.perf_counter()
+    with profiler.phase(profiling.SELECT):
+        reducedTS = reductionCS(TS, B, stamps)
+    t3 = time.perf_counter()
     sTime = t3-t2
 
-    return pTime, sTime, reducedTS
+    return profiling.reduction(profiler, pTime, sTime, reducedTS)
+
+# FAST-CS as a stream (the whole order is sampled at once)
+def fastCSStream(inputFile, dim=0, B=0, memory=True, seed=None,
+                 max_seconds=None, deadline=None, profiler=None):
+    deadline = profiling.stopTime(max_seconds, deadline)
+    pTime, TS = preparation.loadProjection(inputFile, dim=dim, memory=memory,
+                                           seed=seed, profiler=profiler)
+    if B <= 0:
+        B = TS.shape[0]
+    with profiling.phase(profiler, profiling.SELECT):
+        for tc in reductionCS(TS, B):
+            if profiling.expired(deadline):
+                break
+            yield tc
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Full prioritization (budgets as prefixes)
+
+class Prioritization(object):
+    """Full prioritization of a test suite: the reduced test suite of any
+    budget B is its prefix of length B"""
+
+    def __init__(self, pTime, ordering, stamps, profiler=None):
+        self.pTime = pTime
+        self.ordering = ordering
+        # stamps[i]: reduction time of the first i+1 test cases
+        self.stamps = stamps
+        self.profiler = profiler
+
+    def __len__(self):
+        return len(self.ordering)
+
+    # same output as the FAST-R algorithm called with budget B
+    def budget(self, B):
+        if B <= 0 or B > len(self.ordering):
+            B = len(self.ordering)
+        rTime = self.stamps[B-1] if B > 0 else 0.0
+        return self.pTime, rTime, self.ordering[:B]
+
+# compute once the full prioritization of a FAST-R algorithm
+def prioritize(algorithm, inputFile, *args, **kwargs):
+    """INPUT
+    (function)algorithm: fastPlusPlus, fastCS, fast_pw or fast_
+    (str)inputFile: test suite
+    args, kwargs: other parameters of algorithm (except B)
+
+    OUTPUT
+    (Prioritization)prioritization: answers each budget with a prefix"""
+    stamps = []
+    result = algorithm(inputFile, *args, B=0, stamps=stamps, **kwargs)
+    return Prioritization(result.pTime, result.selection, stamps,
+                          result.profiler)
@@ -0,0 +1,235 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import bz2
+import errno
+import glob
+import gzip
+import io
+import lzma
+import os
+import queue
+import re
+import threading
+
+"""
+This file implements the input layer of the test suites. An input is a plain
+text file (one test case per line), a compressed file (gzip, bzip2 or xz), or
+a glob of parts whose concatenation is such a file, e.g. the split dataset
+input/scalability/scalability-bbox.txt.gz_*. An input that does not exist is
+looked up as its compressed versions (<input>.gz, ..., <input>.gz_*).
+Compressed and split inputs are read as one line stream: a background thread
+reads and decompresses the next blocks while the caller shingles or vectorizes
+the current ones, and nothing is written to disk.
+"""
+
+# compression formats: magic number, opener of the decompressed stream
+FORMATS = [(b"\x1f\x8b", lambda fin: gzip.GzipFile(fileobj=fin)),
+           (b"BZh", bz2.BZ2File),
+           (b"\xfd7zXZ\x00", lzma.LZMAFile)]
+# compressed versions of an input that does not exist
+SUFFIXES = [".gz", ".bz2", ".xz", ".gz_*"]
+BLOCK = 1 << 20   # bytes per block read ahead
+DEPTH = 16        # blocks read ahead
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# sort key of file names, with numbers in numeric order (part2 < part10)
+def naturalKey(path):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", path)]
+
+# files whose concatenation is the input
+def parts(input_file):
+    """INPUT
+    (str)input_file: path or glob of the input
+
+    OUTPUT
+    (list)paths: the input itself, or the parts matching the glob (or the
+    compressed versions of the input) in natural order"""
+    if os.path.isfile(input_file):
+        return [input_file]
+    if glob.has_magic(input_file):
+        patterns = [input_file]
+    else:
+        patterns = [input_file + suffix for suffix in SUFFIXES]
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern), key=naturalKey)
+        if len(paths) > 0:
+            return paths
+    raise FileNotFoundError(errno.ENOENT, "no input matches", input_file)
+
+# opener of the decompressed stream of the parts (None if not compressed)
+def compression(paths):
+    with open(paths[0], "rb") as fin:
+        head = fin.read(8)
+    for magic, opener in FORMATS:
+        if head.startswith(magic):
+            return opener
+    return None
+
+# True if the input is one plain file (it can be read by byte ranges)
+def isPlain(input_file):
+    paths = parts(input_file)
+    return len(paths) == 1 and compression(paths) is None
+
+# size in bytes of the input on disk
+def inputSize(input_file):
+    return sum(os.path.getsize(path) for path in parts(input_file))
+
+# (path, size, mtime) of each part, changes if any part changes
+def inputStamp(input_file):
+    stamp = []
+    for path in parts(input_file):
+        st = os.stat(path)
+        stamp.append((os.path.realpath(path), st.st_size, st.st_mtime_ns))
+    return tuple(stamp)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class ConcatenatedParts(io.RawIOBase):
+    """Binary stream of the concatenation of files"""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.next = 0
+        self.fin = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            if self.fin is None:
+                if self.next >= len(self.paths):
+                    return 0
+                self.fin = open(self.paths[self.next], "rb")
+                self.next += 1
+            n = self.fin.readinto(b)
+            if n:
+                return n
+            self.fin.close()
+            self.fin = None
+
+    def close(self):
+        if self.fin is not None:
+            self.fin.close()
+            self.fin = None
+        super(ConcatenatedParts, self).close()
+
+
+class ReadAhead(io.RawIOBase):
+    """Binary stream whose next blocks are read by a background thread while
+    the caller processes the current one (zlib, bz2 and lzma release the GIL
+    while decompressing, so decompression and processing overlap)"""
+
+    def __init__(self, source, block=BLOCK, depth=DEPTH):
+        self.source = source
+        self.blocks = queue.Queue(depth)
+        self.stop = threading.Event()
+        self.pending = memoryview(b"")
+        self.eof = False
+        self.thread = threading.Thread(target=self.readBlocks, args=(block,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    # background thread: read the source block by block
+    def readBlocks(self, block):
+        try:
+            while not self.stop.is_set():
+                data = self.source.read(block)
+                self.put(data)
+                if not data:
+                    return
+        except Exception as e:  # raised again in the reading thread
+            self.put(e)
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if len(self.pending) == 0:
+            if self.eof:
+                return 0
+            item = self.blocks.get()
+            if isinstance(item, Exception):
+                self.eof = True
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.pending = memoryview(item)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+            self.source.close()
+        super(ReadAhead, self).close()
+
+
+# open an input for reading (text lines, or bytes if binary)
+def openInput(input_file, binary=False):
+    """INPUT
+    (str)input_file: path or glob of the input (see parts)
+    (bool)binary: True to read bytes, False to read text
+
+    OUTPUT
+    (file)fin: file object of the (decompressed) content of the input"""
+    paths = parts(input_file)
+    opener = compression(paths)
+    if len(paths) == 1 and opener is None:
+        return open(paths[0], "rb" if binary else "r")
+
+    source = io.BufferedReader(ConcatenatedParts(paths), BLOCK)
+    if opener is not None:
+        source = opener(source)
+    stream = io.BufferedReader(ReadAhead(source), BLOCK)
+    return stream if binary else io.TextIOWrapper(stream)
+
+# read an input in blocks of about chunk bytes of whole lines
+def lineBlocks(input_file, chunk=1 << 24):
+    """INPUT
+    (str)input_file: path or glob of the input (see parts)
+    (int)chunk: size in bytes of a block
+
+    OUTPUT
+    (generator)blocks: lists of lines (without newline), in input order"""
+    rest = b""
+    with openInput(input_file, binary=True) as fin:
+        while True:
+            data = fin.read(chunk)
+            if not data:
+                break
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end > 0:
+                yield data[:end].decode().split("\n")[:-1]
+    if rest:
+        yield [rest.decode()]
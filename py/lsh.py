@@ -14,11 +14,23 @@ along with this source.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 from collections import defaultdict
+from collections import deque
 from collections import OrderedDict
-import itertools
+import json
+import multiprocessing
+import os
+import random
+import struct
+import tempfile
 
+import numpy as np
+from scipy import sparse
 import xxhash
 
+import inputs
+import observers
+import profiling
+
 """
 This files contains implementations of shingling, minwise hashing, 
 and locality sensitive hashing techniques.
@@ -29,6 +41,30 @@ prioritization algorithms.
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # SHINGLING
 
+# seed and base of the polynomial rolling hash of k-shingles
+SHINGLE_SEED = 0x2545F4914F6CDD1D
+SHINGLE_BASE = np.uint64(0x100000001B3)
+
+# return the k-shingles of a string as uint64 IDs (deterministic)
+def rollingShingles(tc, k, seed=SHINGLE_SEED):
+    """INPUT
+    (str)tc: test case (one bbox line)
+    (int)k: size of k-shingles (in bytes)
+    (int)seed: seed of the rolling hash
+
+    OUTPUT
+    (np.array)shingles: sorted distinct uint64 hashes of the k-byte windows,
+    h = seed * B^k + sum_j byte_j * B^(k-1-j) (mod 2^64)"""
+    data = np.frombuffer(tc.encode(), dtype=np.uint8)
+    windows = len(data) - k + 1
+    if windows <= 0:
+        return np.empty(0, dtype=np.uint64)
+    h = np.full(windows, seed, dtype=np.uint64)
+    for j in range(k):
+        h *= SHINGLE_BASE
+        h += data[j:j + windows]
+    return np.unique(h)
+
 # return the k-shingles of an input test suite.
 def kShingles(TS, k):
     """INPUT
@@ -36,17 +72,26 @@ def kShingles(TS, k):
     (int)k: size of k-shingles
 
     OUTPUT
-    (dict)shingles: key=tcID, value=set of k-shingles of test case ID"""
+    (dict)shingles: key=tcID, value=uint64 array of k-shingles of test case"""
     shingles = OrderedDict()
     for tcID in TS:
-        tc = TS[tcID]
-        shingle = set()
-        for i in range(len(tc) - k + 1):
-            shingle.add(hash(tc[i:i + k]))
-        shingles[tcID] = shingle
+        shingles[tcID] = rollingShingles(TS[tcID], k)
 
     return shingles
 
+# return the shingles of one line of an input file
+def lineShingles(line, bbox=False, k=5):
+    """INPUT
+    (str)line: one test case (without trailing newline)
+    (bool)bbox: True for k-shingles of the line, False for its entities
+    (int)k: size of k-shingles
+
+    OUTPUT
+    (set)shingles: uint64 array of k-shingles (bbox) or set of entities"""
+    if not bbox:
+        return set(line.split())
+    return rollingShingles(line, k)
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # MINWISEHASHING
@@ -54,6 +99,9 @@ def kShingles(TS, k):
 # generate a family of hash functions
 def hashFamily(i):
     def hashMember(x):
+        # xxhash >= 2 only hashes bytes (1.x encoded strings as UTF-8)
+        if isinstance(x, str):
+            x = x.encode()
         return xxhash.xxh64(x, seed=37 * (2 * i + 1)).hexdigest()
 
     return hashMember
@@ -80,9 +128,419 @@ def tcMinhashing(test_case, hash_functions):
     return tc_signature
 
 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# BATCH MINWISEHASHING (vectorized)
+
+# largest minhash value, used to initialize signatures
+MAX_HASH = np.iinfo(np.uint64).max
+
+# splitmix64 finalizer, used to derive the hash coefficients from the seeds
+def _splitmix64(x):
+    x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+# coefficients of the universal hash family (same seeds of hashFamily)
+def hashCoefficients(n):
+    """INPUT
+    (int)n: number of hash functions
+
+    OUTPUT
+    (pair)(A, B): uint64 arrays, h_i(x) = A[i] * x + B[i] (mod 2^64)"""
+    seeds = [37 * (2 * i + 1) for i in range(n)]
+    A = np.array([_splitmix64(s) | 1 for s in seeds], dtype=np.uint64)
+    B = np.array([_splitmix64(s ^ 0xFFFF) for s in seeds], dtype=np.uint64)
+    return A, B
+
+# map the shingles (or entities) of a test case to integer shingle IDs
+def shingleIDs(shingles):
+    """INPUT
+    (set)shingles: uint64 array or set of int shingles (bbox), or set of
+    str entities (wbox)
+
+    OUTPUT
+    (np.array)ids: uint64 array of shingle IDs"""
+    if isinstance(shingles, np.ndarray):
+        return shingles.astype(np.uint64, copy=False)
+    shingles = list(shingles)
+    if len(shingles) > 0 and isinstance(shingles[0], str):
+        return np.array([xxhash.xxh64(s.encode()).intdigest() for s in shingles],
+                        dtype=np.uint64)
+    return np.array(shingles, dtype=np.int64).view(np.uint64)
+
+# signature of the empty test case (all values are MAX_HASH)
+def emptySignature(n):
+    return np.full(n, MAX_HASH, dtype=np.uint64)
+
+# compute minhashing of many test cases at once
+def minhashSignatures(tcs_shingles, n):
+    """INPUT
+    (list(np.array))tcs_shingles: uint64 shingle IDs of each test case
+    (int)n: number of hash functions
+
+    OUTPUT
+    (np.array)signatures: (N x n) uint64 matrix of minhash values"""
+    N = len(tcs_shingles)
+    signatures = np.full((N, n), MAX_HASH, dtype=np.uint64)
+    sizes = np.array([len(s) for s in tcs_shingles], dtype=np.int64)
+    nonempty = np.flatnonzero(sizes)
+    if len(nonempty) == 0:
+        return signatures
+
+    shingles = np.concatenate([tcs_shingles[i] for i in nonempty])
+    starts = np.concatenate(([0], np.cumsum(sizes[nonempty])[:-1]))
+
+    A, B = hashCoefficients(n)
+    for i in range(n):
+        h = shingles * A[i] + B[i]
+        # final avalanche, so that every bit of h depends on every bit of x
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xFF51AFD7ED558CCD)
+        h ^= h >> np.uint64(33)
+        signatures[nonempty, i] = np.minimum.reduceat(h, starts)
+
+    return signatures
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# ONE PERMUTATION HASHING (with optimal densification)
+
+# bin of a hash value among n bins (uses the high 32 bits of the hash)
+def _bin(h, n):
+    return ((h >> np.uint64(32)) * np.uint64(n)) >> np.uint64(32)
+
+# fill the empty bins of one permutation hashing signatures (in place)
+def densify(signatures, empty):
+    """INPUT
+    (np.array)signatures: (N x n) uint64 one permutation hashing signatures
+    (np.array)empty: (N x n) bool, True for the bins with no shingles
+
+    OUTPUT
+    (np.array)signatures: each empty bin i gets the value of the first
+    non-empty bin in the sequence h(i, 1), h(i, 2), ... (Shrivastava, 2017);
+    the sequence is the same for every test case"""
+    N, n = signatures.shape
+    filled = ~empty.all(axis=1)  # skip empty test cases
+    rows, cols = np.nonzero(empty & filled[:, None])
+    mult = np.uint64(0x9E3779B97F4A7C15)
+    attempt = 0
+    while len(rows) > 0:
+        attempt += 1
+        h = cols.astype(np.uint64) * mult + \
+            np.uint64((attempt * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xFF51AFD7ED558CCD)
+        h ^= h >> np.uint64(33)
+        sources = _bin(h, n).astype(np.int64)
+        found = ~empty[rows, sources]
+        signatures[rows[found], cols[found]] = \
+            signatures[rows[found], sources[found]]
+        rows, cols = rows[~found], cols[~found]
+    return signatures
+
+# compute one permutation hashing signatures of many test cases at once
+def ophSignatures(tcs_shingles, n):
+    """INPUT
+    (list(np.array))tcs_shingles: uint64 shingle IDs of each test case
+    (int)n: number of bins (length of the signatures)
+
+    OUTPUT
+    (np.array)signatures: (N x n) uint64 matrix, each shingle is hashed once
+    and falls in one of n bins, each bin keeps its minimum hash value"""
+    N = len(tcs_shingles)
+    signatures = np.full((N, n), MAX_HASH, dtype=np.uint64)
+    sizes = np.array([len(s) for s in tcs_shingles], dtype=np.int64)
+    nonempty = np.flatnonzero(sizes)
+    if len(nonempty) == 0:
+        return signatures
+
+    shingles = np.concatenate([tcs_shingles[i] for i in nonempty])
+    owners = np.repeat(nonempty, sizes[nonempty])
+
+    A, B = hashCoefficients(1)
+    h = shingles * A[0] + B[0]
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    h = np.minimum(h, MAX_HASH - np.uint64(1))  # MAX_HASH marks empty bins
+
+    cells = owners * n + _bin(h, n).astype(np.int64)
+    np.minimum.at(signatures.reshape(-1), cells, h)
+
+    return densify(signatures, signatures == MAX_HASH)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# PARALLEL MINWISEHASHING (process pool over byte ranges of the input file,
+# or over blocks of lines of a compressed input)
+
+# split a file in byte ranges [start, end) aligned to line boundaries
+def lineRanges(input_file, chunks):
+    size = os.path.getsize(input_file)
+    ranges, start = [], 0
+    with open(input_file, "rb") as fin:
+        for c in range(1, chunks + 1):
+            if start >= size:
+                break
+            end = size * c // chunks
+            if end <= start:
+                continue
+            if end < size:
+                fin.seek(end - 1)
+                fin.readline()  # move to the end of the current line
+                end = fin.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# minhash the test cases (lines) in a byte range of a file (pool worker)
+def _minhashRange(task, profiler=None):
+    input_file, start, end, n, bbox, k, oph = task
+    with open(input_file, "rb") as fin:
+        fin.seek(start)
+        lines = fin.read(end - start).decode().split("\n")
+    if lines[-1] == "":
+        lines.pop()  # the range ends with a newline
+    return _minhashLines((lines, n, bbox, k, oph), profiler)
+
+# minhash a block of test cases (pool worker)
+def _minhashLines(task, profiler=None):
+    lines, n, bbox, k, oph = task
+    with profiling.phase(profiler, profiling.SHINGLE):
+        tcs_shingles = [shingleIDs(lineShingles(line, bbox, k))
+                        for line in lines]
+    if oph:
+        return ophSignatures(tcs_shingles, n)
+    return minhashSignatures(tcs_shingles, n)
+
+# compute the signatures of all test cases of a file, block by block
+def fileSignatureBlocks(input_file, n, bbox=False, k=5, workers=1,
+                        oph=False, chunk=1 << 24, profiler=None):
+    """INPUT
+    (str)input_file: test suite, one test case per line (compressed and
+    split inputs are streamed, see inputs)
+    (int)n: number of hash functions
+    (bool)bbox: True for k-shingles of the lines, False for their entities
+    (int)k: size of k-shingles
+    (int)workers: number of worker processes (None for all cores)
+    (bool)oph: True for one permutation hashing (see ophSignatures)
+    (int)chunk: maximum size in bytes of the input of a block
+    (Profiler)profiler: records the SHINGLE phase (only with one worker)
+
+    OUTPUT
+    (generator)blocks: (N_i x n) signature matrices, in tcID order"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if not inputs.isPlain(input_file):
+        yield from streamSignatureBlocks(input_file, n, bbox, k, workers, oph,
+                                         chunk, profiler)
+        return
+    size = os.path.getsize(input_file)
+    chunks = max(4 * workers, -(-size // chunk))
+    tasks = [(input_file, start, end, n, bbox, k, oph)
+             for start, end in lineRanges(input_file, chunks)]
+
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for block in pool.imap(_minhashRange, tasks):
+                yield block
+        finally:
+            pool.terminate()
+    else:
+        for task in tasks:
+            yield _minhashRange(task, profiler)
+
+# signatures of a compressed or split input: its blocks of lines are minhashed
+# while the next ones are decompressed (at most 2 blocks per worker in flight)
+def streamSignatureBlocks(input_file, n, bbox=False, k=5, workers=1,
+                          oph=False, chunk=1 << 24, profiler=None):
+    tasks = ((lines, n, bbox, k, oph)
+             for lines in inputs.lineBlocks(input_file, chunk))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_minhashLines, (task,)))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+    else:
+        for task in tasks:
+            yield _minhashLines(task, profiler)
+
+# compute the (N x n) signature matrix of all test cases of a file
+def fileSignatures(input_file, n, bbox=False, k=5, workers=1, oph=False,
+                   profiler=None):
+    blocks = list(fileSignatureBlocks(input_file, n, bbox, k, workers, oph,
+                                      profiler=profiler))
+    if len(blocks) == 0:
+        return np.empty((0, n), dtype=np.uint64)
+    return np.concatenate(blocks)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# SIGNATURE STORAGE (binary, memory-mapped)
+
+# file layout: fixed-size header followed by the (N x n) little-endian
+# uint64 signature matrix, one row per test case (in tcID order)
+SIG_MAGIC = b"FASTRSIG"
+SIG_VERSION = 4
+# magic, version, n, k, bbox, oph, N, checksum of the input file
+SIG_HEADER = struct.Struct("<8sIIIII4xQQ")
+SIG_HEADER_SIZE = 64
+SIG_DTYPE = np.dtype("<u8")
+
+# band keys are stored in their own file (one per (b, r)), never appended to
+# the signatures: fixed-size header followed by the (N x b) uint64 keys
+KEY_MAGIC = b"FASTRKEY"
+KEY_VERSION = 1
+# magic, version, b, r, N, checksum of the input file
+KEY_HEADER = struct.Struct("<8sIII4xQQ")
+
+# checksum of the content of a file, or of the parts of a split input (used
+# to detect stale signatures)
+def fileChecksum(path, chunk=1 << 20):
+    h = xxhash.xxh64()
+    for part in inputs.parts(path):
+        with open(part, "rb") as fin:
+            for block in iter(lambda: fin.read(chunk), b""):
+                h.update(block)
+    return h.intdigest()
+
+# write (or rewrite) the header of a binary signature file
+def writeSignatureHeader(fout, n, k, bbox, N, checksum, oph=False):
+    header = SIG_HEADER.pack(SIG_MAGIC, SIG_VERSION, n, k, int(bbox),
+                             int(oph), N, checksum)
+    fout.seek(0)
+    fout.write(header.ljust(SIG_HEADER_SIZE, b"\0"))
+
+# read the header of a binary signature file
+def readSignatureHeader(sigfile):
+    """INPUT
+    (str)sigfile: path of the binary signature file
+
+    OUTPUT
+    (dict)header: keys=n, k, bbox, oph, N, checksum (None if not valid)"""
+    with open(sigfile, "rb") as fin:
+        raw = fin.read(SIG_HEADER_SIZE)
+    if len(raw) < SIG_HEADER_SIZE:
+        return None
+    magic, version = struct.unpack_from("<8sI", raw)
+    if magic != SIG_MAGIC or version != SIG_VERSION:
+        return None
+    magic, version, n, k, bbox, oph, N, checksum = SIG_HEADER.unpack_from(raw)
+    return {"n": n, "k": k, "bbox": bool(bbox), "oph": bool(oph), "N": N,
+            "checksum": checksum}
+
+# open stored signatures without reading them (pages are loaded on access)
+def openSignatures(sigfile):
+    """INPUT
+    (str)sigfile: path of the binary signature file
+
+    OUTPUT
+    (pair)(header, signatures): header dict and (N x n) read-only np.memmap"""
+    header = readSignatureHeader(sigfile)
+    if header is None:
+        raise ValueError("not a binary signature file: {}".format(sigfile))
+    N, n = header["N"], header["n"]
+    if N == 0:
+        return header, np.empty((0, n), dtype=SIG_DTYPE)
+    signatures = np.memmap(sigfile, dtype=SIG_DTYPE, mode="r",
+                           offset=SIG_HEADER_SIZE, shape=(N, n))
+    return header, signatures
+
+# compute the band keys of stored signatures and store them in keyfile (the
+# signature file is only read; keyfile is replaced atomically when complete)
+def storeBandKeys(sigfile, keyfile, b, r, chunk=1 << 16):
+    """INPUT
+    (str)sigfile: path of the binary signature file
+    (str)keyfile: path of the band key file to write
+    (int)b: number of bands
+    (int)r: number of rows
+    (int)chunk: number of signatures processed at a time
+
+    OUTPUT
+    (int)N: number of test cases"""
+    header, signatures = openSignatures(sigfile)
+    N = header["N"]
+    assert(b * r == header["n"])
+    tmp = "{}.tmp{}".format(keyfile, os.getpid())
+    try:
+        with open(tmp, "wb") as fout:
+            fout.write(KEY_HEADER.pack(KEY_MAGIC, KEY_VERSION, b, r, N,
+                                       header["checksum"]).ljust(
+                                           SIG_HEADER_SIZE, b"\0"))
+            for start in range(0, N, chunk):
+                keys = bandKeys(signatures[start:start + chunk], b, r)
+                fout.write(keys.astype(SIG_DTYPE, copy=False).tobytes())
+        os.replace(tmp, keyfile)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return N
+
+# open the band keys stored by storeBandKeys (None if b, r or N differ)
+def openBandKeys(keyfile, b, r, N=None):
+    """INPUT
+    (str)keyfile: path of the band key file
+    (int)b: number of bands
+    (int)r: number of rows
+    (int)N: expected number of test cases (None to skip the check)
+
+    OUTPUT
+    (np.array)keys: (N x b) read-only np.memmap of band keys (or None)"""
+    with open(keyfile, "rb") as fin:
+        raw = fin.read(SIG_HEADER_SIZE)
+    if len(raw) < SIG_HEADER_SIZE:
+        return None
+    magic, version, kb, kr, kN, checksum = KEY_HEADER.unpack_from(raw)
+    if magic != KEY_MAGIC or version != KEY_VERSION:
+        return None
+    if kb != b or kr != r or (N is not None and kN != N):
+        return None
+    if kN == 0:
+        return np.empty((0, b), dtype=SIG_DTYPE)
+    return np.memmap(keyfile, dtype=SIG_DTYPE, mode="r",
+                     offset=SIG_HEADER_SIZE, shape=(kN, b))
+
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # LOCALITY SENSITIVE HASHING (LSH)
 
+# multiplier used to pack the r minhash values of a band into one key
+BAND_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+# signatures as an uint64 array (hex strings of tcMinhashing are parsed)
+def signatureArray(signatures):
+    signatures = np.asarray(signatures)
+    if signatures.dtype.kind in "USO":
+        signatures = np.vectorize(lambda h: int(h, 16),
+                                  otypes=[np.uint64])(signatures)
+    return signatures.astype(np.uint64, copy=False)
+
+# compute the integer band keys of one or more signatures
+def bandKeys(signatures, b, r):
+    """INPUT
+    (np.array)signatures: (N x n) or (n,) uint64 minhash signatures
+    (int)b: number of bands
+    (int)r: number of rows
+
+    OUTPUT
+    (np.array)keys: (N x b) or (b,) uint64 keys, key = sum v_j * M^(r-1-j)"""
+    signatures = np.asarray(signatures, dtype=np.uint64)
+    bands = signatures.reshape(signatures.shape[:-1] + (b, r))
+    keys = bands[..., 0].copy()
+    for j in range(1, r):
+        keys *= BAND_MULT
+        keys += bands[..., j]
+    return keys
+
 # implement the LSH bucket for fast similarity-based search
 def LSHBucket(minhashes, b, r, n):
     """INPUT
@@ -95,20 +553,21 @@ def LSHBucket(minhashes, b, r, n):
     (dict(dict))LSHBuckets: key=band, val=dict(key=col_sig, val=set(tc_IDs))"""
     assert(b * r == n)
 
+    minhashes = list(minhashes)
+    tc_IDs = [tc_ID for tc_ID, signatures in minhashes]
+    if len(minhashes) > 0:
+        keys = bandKeys(signatureArray(
+            [signatures for tc_ID, signatures in minhashes]), b, r)
+    else:
+        keys = np.empty((0, b), dtype=np.uint64)
+
     # key=band, val=dict(key=col_sig, val=set(tc_IDs))
     bucket = defaultdict(dict)
-    i = 0
-    while i < n:  # for each band
+    for band, i in enumerate(range(0, n, r)):  # for each band
         bucket[i] = defaultdict(set)  # to catch collisions in each band
-        for tc_signature in minhashes:
-            tc_ID, signatures = tc_signature
-            column = signatures[i:i + r]
-            column_signature = hash(str(column))
-
+        for tc_ID, column_signature in zip(tc_IDs, keys[:, band].tolist()):
             bucket[i][column_signature].add(tc_ID)
 
-        i += r  # next band
-
     return bucket
 
 # return the set of possibly similar test cases using LSH bucket
@@ -126,36 +585,489 @@ def LSHCandidates(bucket, signature, b, r, n):
 
     candidates = set()
 
-    i = 0
-    while i < n:  # for each band
-        tc_ID0, minhash = signature
-        column = minhash[i:i + r]
-        column_signature = hash(str(column))
+    tc_ID0, minhash = signature
+    keys = bandKeys(signatureArray(minhash), b, r).tolist()
+    for band, i in enumerate(range(0, n, r)):  # for each band
+        candidates.update(bucket[i].get(keys[band], ()))
+
+    return candidates
 
-        for tc_ID in bucket[i][column_signature]:
-            candidates.add(tc_ID)
+# array-backed LSH index supporting removal of test cases
+class LSHIndex(object):
+    """For each band the index stores the sorted distinct band keys and,
+    CSR-style, the rows of the test cases falling in each bucket:
+    members[indptr[j]:indptr[j+1]] are the rows with key keys[j].
+    Removed test cases are only marked dead (tombstones) and are dropped
+    from the member arrays when they make up more than COMPACT of them."""
 
-        i += r  # next band
+    COMPACT = 0.5
 
-    return candidates
+    def __init__(self, tcIDs, signatures, b, r, n, keys=None,
+                 observer=observers.NULL):
+        """INPUT
+        (list)tcIDs: IDs of the test cases (one per signature)
+        (np.array)signatures: (N x n) minhash signatures
+        (int)b: number of bands
+        (int)r: number of rows
+        (int)n: number of hash functions (n = b*r)
+        (np.array)keys: (N x b) precomputed band keys (see bandKeys)
+        (Observer)observer: receives the LSH_HITS, LSH_MISSES and REBUILD
+        events (see observers)"""
+        assert(b * r == n)
+        N = len(tcIDs)
+        self.b, self.r, self.n = b, r, n
+        self.observer = observer
+        self.tcIDs = np.asarray(tcIDs)
+        self.rows = {tcID: row for row, tcID in enumerate(tcIDs)}
+        self.alive = np.ones(N, dtype=bool)
+        self.dead = 0
+
+        if keys is None:
+            if N > 0:
+                keys = bandKeys(signatures, b, r)
+            else:
+                keys = np.empty((0, b), dtype=np.uint64)
+
+        rowType = np.int32 if N < 2 ** 31 else np.int64
+        self.keys, self.indptr, self.members = [], [], []
+        for band in range(b):
+            bandKey = np.asarray(keys[:, band])
+            order = np.argsort(bandKey, kind="mergesort")
+            distinct, starts = np.unique(bandKey[order], return_index=True)
+            self.keys.append(distinct)
+            self.indptr.append(np.append(starts, N).astype(np.int64))
+            self.members.append(order.astype(rowType))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, tcID):
+        return tcID in self.rows
+
+    # remove a test case from the index (tombstone)
+    def remove(self, tcID):
+        row = self.rows.pop(tcID, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.dead += 1
+        if self.dead > self.COMPACT * (len(self.rows) + self.dead):
+            self.compact()
+
+    # drop the removed test cases from the member arrays
+    def compact(self):
+        for j in range(self.b):
+            members, indptr = self.members[j], self.indptr[j]
+            keep = self.alive[members]
+            bucketOf = np.repeat(np.arange(len(self.keys[j])), np.diff(indptr))
+            counts = np.bincount(bucketOf[keep], minlength=len(self.keys[j]))
+            nonempty = counts > 0
+            self.keys[j] = self.keys[j][nonempty]
+            self.indptr[j] = np.concatenate(([0], np.cumsum(counts[nonempty])))
+            self.members[j] = members[keep]
+        self.dead = 0
+        self.observer.event(observers.REBUILD, len(self.rows))
+
+    # return the rows of the possibly similar test cases (not removed)
+    def candidateRows(self, signature):
+        """INPUT
+        (np.array)signature: minhash signature of the query
+
+        OUTPUT
+        (np.array)rows: distinct rows sharing at least a bucket with the query"""
+        hits = []
+        query = bandKeys(signature, self.b, self.r)
+        for j in range(self.b):  # for each band
+            keys = self.keys[j]
+            pos = np.searchsorted(keys, query[j])
+            if pos < len(keys) and keys[pos] == query[j]:
+                indptr = self.indptr[j]
+                hits.append(self.members[j][indptr[pos]:indptr[pos + 1]])
+        self.observer.event(observers.LSH_HITS, len(hits))
+        self.observer.event(observers.LSH_MISSES, self.b - len(hits))
+
+        if len(hits) == 0:
+            return np.empty(0, dtype=np.int64)
+        hits = np.concatenate(hits)
+        return np.unique(hits[self.alive[hits]])
+
+    # return the set of possibly similar test cases (see LSHCandidates)
+    def candidates(self, signature):
+        """INPUT
+        (np.array)signature: minhash signature of the query
+
+        OUTPUT
+        (set)candidates: set of possibly similar (not removed) test cases"""
+        return set(self.tcIDs[self.candidateRows(signature)].tolist())
+
+
+# test cases not selected yet by FAST-pw and FAST-f, indexed by row
+class CandidatePool(object):
+    """selected[row] flags the selected (or discarded) test cases and
+    alive[:size] lists the other rows in no particular order, with pos[row]
+    the position of row in alive: a test case is removed in O(1) by moving
+    the last alive row in its place. The LSH hits of the current iteration
+    are flagged in hit, so the candidates (alive rows that are not hits) are
+    counted in O(1) and sampled in O(hits + sample) without building sets."""
+
+    def __init__(self, N):
+        rowType = np.int32 if N < 2 ** 31 else np.int64
+        self.selected = np.zeros(N, dtype=bool)
+        self.alive = np.arange(N, dtype=rowType)
+        self.pos = np.arange(N, dtype=rowType)
+        self.size = N
+        self.hit = np.zeros(N, dtype=bool)
+        self.hitRows = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, row):
+        return not self.selected[row]
+
+    # remove a test case from the pool (and from the current hits)
+    def remove(self, row):
+        if self.selected[row]:
+            return
+        self.selected[row] = True
+        i, last = self.pos[row], self.alive[self.size - 1]
+        self.alive[i], self.pos[last] = last, i
+        self.size -= 1
+        if self.hit[row]:
+            self.hit[row] = False
+            self.hitRows = self.hitRows[self.hitRows != row]
+
+    # flag the LSH hits of the current iteration (distinct alive rows)
+    def flag(self, rows=()):
+        self.hit[self.hitRows] = False
+        self.hitRows = np.asarray(rows, dtype=np.int64)
+        self.hit[self.hitRows] = True
+
+    # number of candidates (alive rows that are not hits)
+    def candidateCount(self):
+        return self.size - len(self.hitRows)
+
+    # rows of the candidates (in no particular order)
+    def candidates(self):
+        rows = self.alive[:self.size]
+        if len(self.hitRows) == 0:
+            return rows.copy()
+        return rows[~self.hit[rows]]
+
+    # k distinct random candidates (rows)
+    def sample(self, k):
+        count = self.candidateCount()
+        if 2 * len(self.hitRows) > self.size or 2 * k > count:
+            return random.sample(self.candidates().tolist(), k)
+
+        # rejection sampling: at least half of the draws are accepted
+        chosen, seen = [], set()
+        while len(chosen) < k:
+            row = int(self.alive[random.randrange(self.size)])
+            if not self.hit[row] and row not in seen:
+                seen.add(row)
+                chosen.append(row)
+        return chosen
+
+
+# store a (n, b, r) LSH profile (see tuneLSH.py)
+def storeProfile(profile_file, profile):
+    with open(profile_file, "w") as fout:
+        json.dump(profile, fout, indent=2, sort_keys=True)
+        fout.write("\n")
+
+# load a (n, b, r) LSH profile, returns the parameters (r, b) of FAST
+def loadProfile(profile_file):
+    with open(profile_file) as fin:
+        profile = json.load(fin)
+    r, b = int(profile["r"]), int(profile["b"])
+    assert(b * r == int(profile["n"]))
+    return r, b
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # JACCARD SIMILARITY/DISTANCE EXACT AND ESTIMATES
 
+# exact jaccard similarity from intersection and set sizes
+def jaccard(intersection, sizeA, sizeB):
+    """INPUT
+    (np.array)intersection: sizes of the intersections |A & B|
+    (np.array)sizeA: sizes |A| (broadcastable)
+    (np.array)sizeB: sizes |B| (broadcastable)
+
+    OUTPUT
+    (np.array)similarity: |A & B| / |A | B| (1.0 if both sets are empty)"""
+    intersection = np.asarray(intersection, dtype=np.float64)
+    union = sizeA + sizeB - intersection
+    return np.divide(intersection, union, out=np.ones_like(union),
+                     where=union > 0)
+
 # exact jaccard similarity
 def jSimilarity(a, b):
-    return float(len(a & b)) / len(a | b)
+    return float(jaccard(len(a & b), len(a), len(b)))
 
 # exact jaccard distance
 def jDistance(a, b):
     return 1.0 - jSimilarity(a, b)
 
+# sparse test case x entity incidence matrix for exact jaccard in blocks
+class IncidenceMatrix(object):
+    """Row i of the (N x E) CSR matrix has a 1 for each entity covered by
+    test case tcIDs[i]; the intersections of a block of test cases with
+    another block are a single sparse matrix product."""
+
+    def __init__(self, TS):
+        """INPUT
+        (dict)TS: key=tcID, value=set of entities"""
+        self.tcIDs = list(TS.keys())
+        self.rows = {tcID: row for row, tcID in enumerate(self.tcIDs)}
+        vocabulary = {}
+        indices = [vocabulary.setdefault(e, len(vocabulary))
+                   for tcID in self.tcIDs for e in TS[tcID]]
+        self.sizes = np.array([len(TS[tcID]) for tcID in self.tcIDs],
+                              dtype=np.int64)
+        indptr = np.concatenate(([0], np.cumsum(self.sizes)))
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32),
+             np.array(indices, dtype=np.int64), indptr),
+            shape=(len(self.tcIDs), max(len(vocabulary), 1)))
+
+    # rows of the given test cases (in the given order)
+    def rowsOf(self, tcIDs):
+        return np.fromiter((self.rows[tcID] for tcID in tcIDs),
+                           dtype=np.int64, count=len(tcIDs))
+
+    # exact jaccard similarities between two blocks of test cases
+    def similarities(self, tcsA, tcsB):
+        """INPUT
+        (list)tcsA: block of test cases (e.g. candidates)
+        (list)tcsB: block of test cases (e.g. already selected)
+
+        OUTPUT
+        (np.array)similarity: (|tcsA| x |tcsB|) exact jaccard similarities"""
+        rowsA, rowsB = self.rowsOf(tcsA), self.rowsOf(tcsB)
+        intersection = (self.matrix[rowsA] @ self.matrix[rowsB].T).toarray()
+        return jaccard(intersection, self.sizes[rowsA][:, None],
+                       self.sizes[rowsB][None, :])
+
+    # exact jaccard distances between two blocks of test cases
+    def distances(self, tcsA, tcsB):
+        return 1.0 - self.similarities(tcsA, tcsB)
+
 # estimate jaccard similarity using minhashing
 def jSimilarityEstimate(s1, s2):
     assert(len(s1) == len(s2))
-    return sum([1 for i in range(len(s1)) if s1[i] == s2[i]]) / float(len(s1))
+    return np.count_nonzero(np.asarray(s1) == np.asarray(s2)) / float(len(s1))
 
 # estimate jaccard distance using minhashing
 def jDistanceEstimate(s1, s2):
     return 1.0 - jSimilarityEstimate(s1, s2)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# SIGNATURE MATRIX (batched jaccard estimates)
+
+# minhash signatures of a test suite, one row per test case
+class SignatureMatrix(object):
+    """Wraps an (N x n) signature matrix (in memory or np.memmap) and maps
+    test case IDs to rows, so that candidates can be scored in batch."""
+
+    def __init__(self, tcIDs, signatures):
+        """INPUT
+        (list)tcIDs: IDs of the test cases (one per signature)
+        (np.array)signatures: (N x n) uint64 minhash signatures"""
+        self.tcIDs = list(tcIDs)
+        self.signatures = signatures
+        self.rows = {tcID: row for row, tcID in enumerate(self.tcIDs)}
+        self.n = signatures.shape[1] if len(self.tcIDs) > 0 else 0
+
+    def __len__(self):
+        return len(self.tcIDs)
+
+    def __getitem__(self, tcID):
+        return self.signatures[self.rows[tcID]]
+
+    # estimated jaccard distances between a signature and the given rows
+    def distances(self, signature, rows):
+        """INPUT
+        (np.array)signature: minhash signature (e.g. union sketch)
+        (np.array)rows: rows of the signature matrix
+
+        OUTPUT
+        (np.array)distances: estimated jaccard distance of each row"""
+        equal = np.count_nonzero(self.signatures[rows] == signature, axis=1)
+        return 1.0 - equal / float(self.n)
+
+    # row at maximum estimated jaccard distance (lowest row among ties)
+    def farthest(self, signature, rows):
+        """INPUT
+        (np.array)signature: minhash signature (e.g. union sketch)
+        (np.array)rows: rows of the signature matrix (non-empty, any order)
+
+        OUTPUT
+        (pair)(row, dist): farthest row and its estimated distance"""
+        distances = self.distances(signature, rows)
+        dist = distances.max()
+        return int(rows[distances == dist].min()), float(dist)
+
+    # merge the given rows into a union sketch (elementwise minimum, in place)
+    def merge(self, sketch, rows):
+        if len(rows) > 0:
+            np.minimum(sketch, self.signatures[rows].min(axis=0), out=sketch)
+        return sketch
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# B-BIT MINWISEHASHING
+
+# number of bits set in each byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# bit masks selecting the lowest bit of each field of a byte
+_FIELD_MASK = {1: 0xFF, 2: 0x55, 4: 0x11, 8: 0x01}
+
+# keep the lowest bits of each minhash, packed into bytes
+def packBBit(signatures, bits):
+    """INPUT
+    (np.array)signatures: (N x n) or (n,) uint64 minhash signatures
+    (int)bits: bits kept per minhash (1, 2, 4 or 8)
+
+    OUTPUT
+    (np.array)packed: (N x ceil(n*bits/8)) or (ceil(n*bits/8),) uint8"""
+    assert(bits in _FIELD_MASK)
+    signatures = np.asarray(signatures, dtype=np.uint64)
+    low = (signatures & np.uint64((1 << bits) - 1)).astype(np.uint8)
+    per = 8 // bits  # minhashes per byte
+    n = low.shape[-1]
+    pad = -n % per
+    if pad > 0:
+        low = np.concatenate(
+            (low, np.zeros(low.shape[:-1] + (pad,), dtype=np.uint8)), axis=-1)
+    low = low.reshape(low.shape[:-1] + (-1, per))
+    packed = np.zeros(low.shape[:-1], dtype=np.uint8)
+    for j in range(per):
+        packed |= low[..., j] << np.uint8(j * bits)
+    return packed
+
+# number of different b-bit minhashes between packed signatures
+def bBitMismatches(packed, query, bits):
+    x = np.bitwise_xor(packed, query)
+    fold = x.copy()
+    for s in range(1, bits):
+        fold |= x >> np.uint8(s)
+    fold &= np.uint8(_FIELD_MASK[bits])
+    return _POPCOUNT[fold].sum(axis=-1, dtype=np.int64)
+
+# estimate jaccard similarity from the fraction of equal b-bit minhashes
+def bBitSimilarity(equal, bits):
+    """Two b-bit minhashes are equal with probability
+    C + (1 - C) * J, where C = 2^-bits (sparse sets, Li and Konig, 2010).
+    The estimate is not clipped: below chance it is negative, so that the
+    candidates can still be ranked."""
+    C = 1.0 / (1 << bits)
+    return (equal - C) / (1.0 - C)
+
+# b-bit signatures of all test cases of a file: the band keys and the packed
+# b-bit minhashes are kept in memory, the full signatures are written to a
+# temporary file (deleted when the returned np.memmap is released)
+def fileBBitSignatures(input_file, n, b, r, bits, bbox=False, k=5,
+                       workers=1, oph=False, profiler=None):
+    """INPUT
+    (str)input_file: test suite, one test case per line
+    (int)n: number of hash functions
+    (int)b: number of bands
+    (int)r: number of rows
+    (int)bits: bits kept per minhash (1, 2, 4 or 8)
+
+    OUTPUT
+    (tuple)(signatures, keys, packed): (N x n) read-only np.memmap of the full
+    signatures, (N x b) band keys, (N x ceil(n*bits/8)) packed minhashes"""
+    keys, packed, N = [], [], 0
+    with tempfile.TemporaryFile() as fout:
+        for sigs in fileSignatureBlocks(input_file, n, bbox, k, workers, oph,
+                                        profiler=profiler):
+            keys.append(bandKeys(sigs, b, r))
+            packed.append(packBBit(sigs, bits))
+            fout.write(sigs.astype(SIG_DTYPE, copy=False).tobytes())
+            N += len(sigs)
+        fout.flush()
+        if N == 0:
+            return (np.empty((0, n), dtype=SIG_DTYPE),
+                    np.empty((0, b), dtype=np.uint64),
+                    np.empty((0, -(-n * bits // 8)), dtype=np.uint8))
+        signatures = np.memmap(fout, dtype=SIG_DTYPE, mode="r", shape=(N, n))
+    return signatures, np.concatenate(keys), np.concatenate(packed)
+
+# packed b-bit minhashes are stored in their own file (one per bits), next to
+# the signatures they are computed from: fixed-size header followed by the
+# (N x ceil(n*bits/8)) uint8 matrix
+BIT_MAGIC = b"FASTRBIT"
+BIT_VERSION = 1
+# magic, version, n, bits, N, checksum of the input file
+BIT_HEADER = struct.Struct("<8sIII4xQQ")
+
+# compute the packed b-bit minhashes of stored signatures and store them in
+# bitfile (the signature file is only read; bitfile is replaced atomically)
+def storeBBitSignatures(sigfile, bitfile, bits, chunk=1 << 16):
+    header, signatures = openSignatures(sigfile)
+    N, n = header["N"], header["n"]
+    tmp = "{}.tmp{}".format(bitfile, os.getpid())
+    try:
+        with open(tmp, "wb") as fout:
+            fout.write(BIT_HEADER.pack(BIT_MAGIC, BIT_VERSION, n, bits, N,
+                                       header["checksum"]).ljust(
+                                           SIG_HEADER_SIZE, b"\0"))
+            for start in range(0, N, chunk):
+                fout.write(packBBit(signatures[start:start + chunk],
+                                    bits).tobytes())
+        os.replace(tmp, bitfile)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return N
+
+# open the packed b-bit minhashes stored by storeBBitSignatures (None if n,
+# bits or N differ)
+def openBBitSignatures(bitfile, n, bits, N=None):
+    """OUTPUT
+    (np.array)packed: (N x ceil(n*bits/8)) read-only np.memmap (or None)"""
+    with open(bitfile, "rb") as fin:
+        raw = fin.read(SIG_HEADER_SIZE)
+    if len(raw) < SIG_HEADER_SIZE:
+        return None
+    magic, version, bn, bbits, bN, checksum = BIT_HEADER.unpack_from(raw)
+    if magic != BIT_MAGIC or version != BIT_VERSION:
+        return None
+    if bn != n or bbits != bits or (N is not None and bN != N):
+        return None
+    width = -(-n * bits // 8)
+    if bN == 0:
+        return np.empty((0, width), dtype=np.uint8)
+    return np.memmap(bitfile, dtype=np.uint8, mode="r",
+                     offset=SIG_HEADER_SIZE, shape=(bN, width))
+
+# signature matrix scored on packed b-bit minhashes
+class BBitSignatureMatrix(SignatureMatrix):
+    """Candidates are scored on the packed (N x ceil(n*bits/8)) b-bit matrix,
+    the only matrix read as a whole. The union sketch is an elementwise
+    minimum of full minhashes, which b-bit values cannot reproduce: the full
+    signatures stay on disk (np.memmap) and only the rows merged into the
+    sketch are read."""
+
+    def __init__(self, tcIDs, packed, bits, signatures):
+        """INPUT
+        (list)tcIDs: IDs of the test cases (one per signature)
+        (np.array)packed: (N x ceil(n*bits/8)) packed b-bit minhashes
+        (int)bits: bits kept per minhash (1, 2, 4 or 8)
+        (np.array)signatures: (N x n) np.memmap of the full signatures"""
+        SignatureMatrix.__init__(self, tcIDs, signatures)
+        self.bits = bits
+        self.packed = packed
+
+    # estimated jaccard distances, unclipped (see bBitSimilarity): below
+    # chance similarity the candidates are still ranked, not tied at 1.0
+    def distances(self, signature, rows):
+        query = packBBit(signature, self.bits)
+        mismatches = bBitMismatches(self.packed[rows], query, self.bits)
+        return 1.0 - bBitSimilarity(1.0 - mismatches / float(self.n),
+                                    self.bits)
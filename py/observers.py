@@ -0,0 +1,146 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import defaultdict
+import json
+import sys
+import time
+
+"""
+This file implements the observers of the reduction loops (FAST-pw, FAST-f,
+ART-D, ART-F and their adequate variants). The loops report structured events
+to an observer, as observer.event(name, value); the default observer (NULL)
+ignores them, so an unobserved run only pays a method call per event.
+Built-in observers count the events (Counters), build histograms of their
+values (Histograms), write them as a JSON-lines trace (JSONTrace) or print the
+progress of the loop (Progress); Observers forwards the events to several
+observers.
+"""
+
+# events (value)
+START = "start"              # test cases to be selected
+ITERATION = "iteration"      # iteration number
+SELECTED = "selected"        # ID of the selected test case
+CANDIDATES = "candidates"    # size of the candidate set
+SIMILAR = "similar"          # test cases in the buckets of the LSH query
+LSH_HITS = "lsh_hits"        # bands in which the LSH query hits a bucket
+LSH_MISSES = "lsh_misses"    # bands in which the LSH query hits no bucket
+REBUILD = "rebuild"          # test cases kept by an LSH index rebuild
+DISTANCES = "distances"      # distance evaluations
+RESET = "reset"              # resets of the union signature
+REMOVED = "removed"          # test cases removed by the adequacy filter
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# observer ignoring every event
+class Observer(object):
+
+    def event(self, name, value=1):
+        pass
+
+    def close(self):
+        pass
+
+NULL = Observer()
+
+
+# forward the events to several observers
+class Observers(Observer):
+
+    def __init__(self, *observers):
+        self.observers = observers
+
+    def event(self, name, value=1):
+        for observer in self.observers:
+            observer.event(name, value)
+
+    def close(self):
+        for observer in self.observers:
+            observer.close()
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# number of events and sum of their values, per event
+class Counters(Observer):
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.totals = defaultdict(int)
+
+    def event(self, name, value=1):
+        self.counts[name] += 1
+        self.totals[name] += value
+
+    def report(self):
+        return {name: {"count": self.counts[name], "total": self.totals[name]}
+                for name in sorted(self.counts)}
+
+
+# histogram of the values of each event, in power-of-two bins
+class Histograms(Observer):
+    """Bin i counts the values v with 2^(i-1) <= v < 2^i (bin 0: v <= 0)"""
+
+    def __init__(self, events=(CANDIDATES, SIMILAR, DISTANCES, REMOVED)):
+        self.events = set(events)
+        self.bins = defaultdict(lambda: defaultdict(int))
+
+    def event(self, name, value=1):
+        if name in self.events:
+            self.bins[name][int(value).bit_length() if value > 0 else 0] += 1
+
+    def report(self):
+        report = {}
+        for name in sorted(self.bins):
+            bins = self.bins[name]
+            report[name] = {
+                "{}-{}".format(1 << i >> 1, (1 << i) - 1): bins[i]
+                for i in sorted(bins)}
+        return report
+
+
+# one JSON object per event: {"time": seconds, "event": name, "value": value}
+class JSONTrace(Observer):
+
+    def __init__(self, traceFile):
+        self.fout = open(traceFile, "w")
+        self.start = time.time()
+
+    def event(self, name, value=1):
+        self.fout.write(json.dumps({"time": time.time() - self.start,
+                                    "event": name, "value": value},
+                                   default=lambda x: x.item()))
+        self.fout.write("\n")
+
+    def close(self):
+        self.fout.close()
+
+
+# progress of the reduction loop (every `every` iterations)
+class Progress(Observer):
+
+    def __init__(self, every=100, stream=sys.stderr):
+        self.every = every
+        self.stream = stream
+        self.total = 0.0
+
+    def event(self, name, value=1):
+        if name == START:
+            self.total = float(value)
+        elif name == ITERATION and value % self.every == 0:
+            self.stream.write("  Progress: {}%\r".format(
+                round(100*value/max(self.total, 1.0), 2)))
+            self.stream.flush()
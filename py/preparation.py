@@ -0,0 +1,452 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import random
+import struct
+import time
+
+import numpy as np
+from scipy import sparse
+
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.random_projection import johnson_lindenstrauss_min_dim
+from sklearn.random_projection import SparseRandomProjection
+
+import cache
+import inputs
+import lsh
+import observers
+import profiling
+
+
+"""
+This file implements the preparation phase shared by fastr and fastr_adequate:
+the minhash signatures and the LSH index of FAST-pw and FAST-f, the random
+projection of FAST++ and FAST-CS (in memory, or stored on disk in the artifact
+cache), and the euclidean distances and sampling weights on the projection.
+"""
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Test cases
+
+# number of test cases (lines) of a file
+def countTestCases(inputFile):
+    with inputs.openInput(inputFile, binary=True) as fin:
+        return sum(1 for line in fin)
+
+# read a file in batches of test cases
+def testCaseBatches(inputFile, batch):
+    testCases = []
+    with inputs.openInput(inputFile) as fin:
+        for line in fin:
+            testCases.append(line.rstrip("\n"))
+            if len(testCases) == batch:
+                yield testCases
+                testCases = []
+    if len(testCases) > 0:
+        yield testCases
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Minhash signatures and LSH index (FAST-pw, FAST-f)
+
+# store signatures on disk for future re-use (binary, see lsh.openSignatures)
+def storeSignatures(input_file, sigfile, n, bbox=False, k=5, workers=1,
+                    oph=False, profiler=None):
+    N = 0
+    with open(sigfile, "wb") as sigfile:
+        lsh.writeSignatureHeader(sigfile, n, k, bbox, 0, 0, oph=oph)
+        for sigs in lsh.fileSignatureBlocks(input_file, n, bbox, k, workers,
+                                            oph, profiler=profiler):
+            sigfile.write(sigs.astype(lsh.SIG_DTYPE, copy=False).tobytes())
+            N += len(sigs)
+        lsh.writeSignatureHeader(sigfile, n, k, bbox, N,
+                                 lsh.fileChecksum(input_file), oph=oph)
+
+# signatures of input_file from the artifact cache (built on a miss)
+def cachedSignatures(input_file, n, bbox=False, k=5, workers=1, oph=False,
+                     profiler=None):
+    """OUTPUT
+    (pair)(sigfile, mh_time): binary signature file and the time it took to
+    compute the signatures"""
+    def build(sigfile):
+        mh_t = time.perf_counter()
+        with profiling.phase(profiler, profiling.MINHASH):
+            storeSignatures(input_file, sigfile, n, bbox, k, workers, oph,
+                            profiler)
+        return {"time": time.perf_counter() - mh_t}
+
+    params = {"n": n, "bbox": bool(bbox), "k": k if bbox else 0,
+              "oph": bool(oph), "format": lsh.SIG_VERSION}
+    sigfile, meta = cache.defaultCache().fetch("sig", input_file, params,
+                                               build, ext=".sig")
+    return sigfile, meta["time"]
+
+# band keys of the signatures in sigfile from the artifact cache, stored in
+# their own file for each (b, r) (built on a miss, sigfile is only read)
+def cachedBandKeys(input_file, sigfile, b, r, bbox=False, k=5, oph=False):
+    def build(keyfile):
+        lsh.storeBandKeys(sigfile, keyfile, b, r)
+        return {}
+
+    params = {"n": b * r, "b": b, "r": r, "bbox": bool(bbox),
+              "k": k if bbox else 0, "oph": bool(oph),
+              "format": [lsh.SIG_VERSION, lsh.KEY_VERSION]}
+    keyfile, meta = cache.defaultCache().fetch("keys", input_file, params,
+                                               build, ext=".keys")
+    return keyfile
+
+# packed b-bit minhashes of the signatures in sigfile from the artifact cache
+# (built on a miss, sigfile is only read)
+def cachedBBitSignatures(input_file, sigfile, n, bits, bbox=False, k=5,
+                         oph=False):
+    def build(bitfile):
+        lsh.storeBBitSignatures(sigfile, bitfile, bits)
+        return {}
+
+    params = {"n": n, "bits": bits, "bbox": bool(bbox), "k": k if bbox else 0,
+              "oph": bool(oph), "format": [lsh.SIG_VERSION, lsh.BIT_VERSION]}
+    bitfile, meta = cache.defaultCache().fetch("bbit", input_file, params,
+                                               build, ext=".bbit")
+    return bitfile
+
+# load stored signatures (memory-mapped, rows are paged in on access)
+def loadSignatures(input_file):
+    start = time.perf_counter()
+    header, signatures = lsh.openSignatures(input_file)
+    sig = lsh.SignatureMatrix(range(1, len(signatures) + 1), signatures)
+    return sig, time.perf_counter() - start
+
+# minhash signatures and LSH index of a test suite (FAST-pw and FAST-f), with
+# bits > 0 the FAST-pw candidates are scored on packed b-bit minhashes
+# Returns: minhashing time, start of the reduction, signatures, LSH index
+def lshSetup(input_file, r, b, bbox=False, k=5, memory=False, profile=None,
+             workers=1, bits=0, oph=False, observer=observers.NULL,
+             profiler=None):
+    if profile is not None:
+        r, b = lsh.loadProfile(profile)
+    n = r * b  # number of hash functions
+
+    if memory and bits > 0:
+        # b-bit minhashes: only the band keys and the packed minhashes are
+        # kept in memory, the full signatures are read for the merged rows
+        mh_t = time.perf_counter()
+        with profiling.phase(profiler, profiling.MINHASH):
+            signatures, keys, packed = lsh.fileBBitSignatures(
+                input_file, n, b, r, bits, bbox, k, workers, oph, profiler)
+        sigs = lsh.BBitSignatureMatrix(range(1, len(packed) + 1), packed,
+                                       bits, signatures)
+        mh_time = time.perf_counter() - mh_t
+        ptime_start = time.perf_counter()
+
+    elif memory:
+        # generate minhashes signatures
+        mh_t = time.perf_counter()
+        with profiling.phase(profiler, profiling.MINHASH):
+            signatures = lsh.fileSignatures(input_file, n, bbox, k, workers,
+                                             oph, profiler)
+        with profiling.phase(profiler, profiling.INDEX):
+            keys = lsh.bandKeys(signatures, b, r)
+        sigs = lsh.SignatureMatrix(range(1, len(signatures) + 1), signatures)
+        mh_time = time.perf_counter() - mh_t
+        ptime_start = time.perf_counter()
+
+    else:
+        # loading input file and generating minhashes signatures
+        sigfile, mh_time = cachedSignatures(input_file, n, bbox, k, workers,
+                                            oph, profiler)
+
+        ptime_start = time.perf_counter()
+        with profiling.phase(profiler, profiling.INDEX):
+            keyfile = cachedBandKeys(input_file, sigfile, b, r, bbox, k, oph)
+            if bits > 0:
+                bitfile = cachedBBitSignatures(input_file, sigfile, n, bits,
+                                               bbox, k, oph)
+        with profiling.phase(profiler, profiling.LOAD):
+            sigs, load_time = loadSignatures(sigfile)
+            keys = lsh.openBandKeys(keyfile, b, r, len(sigs))
+            if bits > 0:
+                # b-bit minhashes: the full signatures stay on disk
+                packed = lsh.openBBitSignatures(bitfile, n, bits, len(sigs))
+                sigs = lsh.BBitSignatureMatrix(sigs.tcIDs, packed, bits,
+                                               sigs.signatures)
+        if keys is None:
+            raise ValueError("band keys do not match: {}".format(keyfile))
+
+    with profiling.phase(profiler, profiling.INDEX):
+        bucket = lsh.LSHIndex(sigs.tcIDs, sigs.signatures, b, r, n,
+                              keys=keys, observer=observer)
+
+    return mh_time, ptime_start, sigs, bucket
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Random projection (FAST++, FAST-CS)
+
+# map a projected test suite to a (N x dim) matrix
+def asMatrix(TS):
+    """INPUT
+    (np.array|csr_matrix|list)TS: projected test suite, as a matrix or as a
+    list of dicts (key=component, val=coordinate)
+
+    OUTPUT
+    (np.array|csr_matrix)TS: (N x dim) matrix, one row per test case"""
+    if isinstance(TS, np.ndarray) or sparse.issparse(TS):
+        return TS
+
+    indptr = np.zeros(len(TS) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(tc) for tc in TS])
+    indices = np.fromiter((j for tc in TS for j in tc.keys()),
+                          dtype=np.int64, count=indptr[-1])
+    data = np.fromiter((v for tc in TS for v in tc.values()),
+                       dtype=np.float64, count=indptr[-1])
+    dim = int(indices.max()) + 1 if len(indices) > 0 else 1
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(TS), dim))
+
+# squared euclidean norm of each test case
+def sqNorms(TS):
+    if sparse.issparse(TS):
+        return np.asarray(TS.multiply(TS).sum(axis=1), dtype=np.float64).ravel()
+    return np.einsum("ij,ij->i", TS, TS)
+
+# squared euclidean distances of all the test cases to a point
+def sqDistancesTo(TS, point, norms, chunk=1 << 22):
+    """INPUT
+    (np.array|csr_matrix)TS: (N x dim) projected test suite
+    (np.array)point: dense point of dimension dim
+    (np.array)norms: squared norms of the rows of TS (sqNorms)
+    (int)chunk: number of matrix entries processed at a time (dense only)
+
+    OUTPUT
+    (np.array)D: D[i] = ||TS[i] - point||^2"""
+    if sparse.issparse(TS):
+        pNorm = np.dot(point, point)
+        D = norms + pNorm - 2 * TS.dot(point)
+        # cancellation: duplicates of the point must be at distance 0
+        D[D <= 1e-12 * (norms + pNorm)] = 0.0
+        return D
+
+    N, dim = TS.shape
+    D = np.empty(N, dtype=np.float64)
+    step = max(1, chunk // max(dim, 1))
+    for start in range(0, N, step):
+        diff = TS[start:start+step] - point
+        D[start:start+step] = np.einsum("ij,ij->i", diff, diff)
+    return D
+
+# squared euclidean distances of all the test cases to test case c
+def sqDistances(TS, c, norms):
+    if sparse.issparse(TS):
+        return sqDistancesTo(TS, TS[c].toarray().ravel(), norms)
+    return sqDistancesTo(TS, np.array(TS[c]), norms)
+
+# Preparation phase for FAST++ and FAST-CS
+# Returns: (N x dim) projected test suite (CSR, or dense array)
+def preparation(inputFile, dim=0, seed=None, profiler=None, batch=1 << 14):
+    vectorizer = HashingVectorizer()  # compute "TF" (stateless)
+    # batches are vectorized while the next test cases are read
+    vectors = []
+    for testCases in testCaseBatches(inputFile, batch):
+        with profiling.phase(profiler, profiling.VECTORIZE):
+            vectors.append(vectorizer.transform(testCases))
+    if len(vectors) > 0:
+        testSuite = sparse.vstack(vectors, format="csr")
+    else:
+        testSuite = vectorizer.transform([])
+
+    # dimensionality reduction
+    if dim <= 0:
+        e = 0.5  # epsilon in jl lemma
+        dim = johnson_lindenstrauss_min_dim(testSuite.shape[0], eps=e)
+    srp = SparseRandomProjection(n_components=dim, random_state=seed)
+    with profiling.phase(profiler, profiling.PROJECT):
+        projectedTestSuite = srp.fit_transform(testSuite)
+
+    # (N x dim) matrix, one row per test case
+    if sparse.issparse(projectedTestSuite):
+        return projectedTestSuite.tocsr()
+    return projectedTestSuite
+
+# projected test suites stored on disk (see storePreparation)
+RP_MAGIC = b"FASTR_RP"
+RP_VERSION = 1
+# magic, version, index itemsize, dim, N, nnz
+RP_HEADER = struct.Struct("<8sIIQQQ")
+RP_HEADER_SIZE = 64
+
+# Chunked preparation phase: the projection is computed batch by batch and
+# stored on disk, so memory is bounded by the batch size (not the suite size)
+def storePreparation(inputFile, rpFile, dim=0, seed=None, batch=1 << 14,
+                     profiler=None):
+    """INPUT
+    (str)inputFile: test suite (one test case per line)
+    (str)rpFile: output file (read it with loadPreparation)
+    (int)dim: dimension of the projection (JL dimension if dim <= 0)
+    (int)seed: random state of the projection
+    (int)batch: number of test cases projected at a time
+    (Profiler)profiler: records the VECTORIZE and PROJECT phases
+
+    OUTPUT
+    (tuple)(N, dim, nnz): shape and non-zeros of the stored projection"""
+    vectorizer = HashingVectorizer()  # compute "TF" (stateless)
+
+    # dimensionality reduction (same projection matrix as preparation)
+    if dim <= 0:
+        # an extra pass over the input, only to get the JL dimension
+        with profiling.phase(profiler, profiling.LOAD):
+            N = countTestCases(inputFile)
+        e = 0.5  # epsilon in jl lemma
+        dim = int(johnson_lindenstrauss_min_dim(N, eps=e))
+    srp = SparseRandomProjection(n_components=dim, random_state=seed)
+    srp.fit(vectorizer.transform([""]))
+
+    # stream data, indices and row pointers to temporary files
+    parts = [rpFile + ext for ext in (".data", ".indices", ".indptr")]
+    N, nnz = 0, 0
+    try:
+        with open(parts[0], "wb") as fdata, open(parts[1], "wb") as findices, \
+                open(parts[2], "wb") as findptr:
+            findptr.write(np.zeros(1, dtype="<i8").tobytes())
+            for testCases in testCaseBatches(inputFile, batch):
+                with profiling.phase(profiler, profiling.VECTORIZE):
+                    vectors = vectorizer.transform(testCases)
+                with profiling.phase(profiler, profiling.PROJECT):
+                    projected = sparse.csr_matrix(srp.transform(vectors))
+                fdata.write(projected.data.astype("<f8").tobytes())
+                findices.write(projected.indices.astype("<i8").tobytes())
+                indptr = projected.indptr[1:].astype("<i8") + nnz
+                findptr.write(indptr.tobytes())
+                N += projected.shape[0]
+                nnz += projected.nnz
+
+        # index type that scipy uses without copying
+        itemsize = 4 if max(nnz, dim) < 2**31 else 8
+        idx = "<i{}".format(itemsize)
+        with open(rpFile, "wb") as fout:
+            fout.write(RP_HEADER.pack(RP_MAGIC, RP_VERSION, itemsize, dim, N,
+                                      nnz).ljust(RP_HEADER_SIZE, b"\0"))
+            for part, src, dst in zip(parts, ("<f8", "<i8", "<i8"),
+                                      ("<f8", idx, idx)):
+                with open(part, "rb") as fin:
+                    for block in iter(lambda: fin.read(1 << 23), b""):
+                        values = np.frombuffer(block, dtype=src)
+                        fout.write(values.astype(dst, copy=False).tobytes())
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+    return N, dim, nnz
+
+# open a projected test suite stored by storePreparation (memory-mapped)
+def loadPreparation(rpFile):
+    with open(rpFile, "rb") as fin:
+        magic, version, itemsize, dim, N, nnz = \
+            RP_HEADER.unpack_from(fin.read(RP_HEADER_SIZE))
+    if magic != RP_MAGIC or version != RP_VERSION:
+        raise ValueError("not a projected test suite: {}".format(rpFile))
+    idx = "<i{}".format(itemsize)
+    offset = RP_HEADER_SIZE
+    arrays = []
+    for dtype, count in (("<f8", nnz), (idx, nnz), (idx, N + 1)):
+        if count == 0:
+            arrays.append(np.zeros(0, dtype=dtype))
+        else:
+            arrays.append(np.memmap(rpFile, dtype=dtype, mode="r",
+                                    offset=offset, shape=(count,)))
+        offset += count * np.dtype(dtype).itemsize
+    data, indices, indptr = arrays
+    return sparse.csr_matrix((data, indices, indptr), shape=(N, dim),
+                             copy=False)
+
+# projected test suite from the artifact cache (built on a miss)
+# Returns: preparation time, (N x dim) projected test suite
+def cachedProjection(inputFile, dim=0, seed=None, batch=1 << 14,
+                     profiler=None):
+    def build(rpFile):
+        t0 = time.perf_counter()
+        storePreparation(inputFile, rpFile, dim=dim, seed=seed, batch=batch,
+                         profiler=profiler)
+        t1 = time.perf_counter()
+        return {"time": t1-t0}
+
+    params = {"dim": dim, "seed": seed, "format": RP_VERSION}
+    rpFile, meta = cache.defaultCache().fetch("rp", inputFile, params, build,
+                                              ext=".rp")
+    with profiling.phase(profiler, profiling.LOAD):
+        TS = loadPreparation(rpFile)
+    return meta["time"], TS
+
+# projected test suite (in memory or from the artifact cache)
+# Returns: preparation time, (N x dim) projected test suite
+def loadProjection(inputFile, dim=0, memory=True, seed=None, profiler=None):
+    if memory:
+        t0 = time.perf_counter()
+        TS = preparation(inputFile, dim=dim, seed=seed, profiler=profiler)
+        t1 = time.perf_counter()
+        return t1-t0, TS
+    return cachedProjection(inputFile, dim=dim, seed=seed, profiler=profiler)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Sampling (FAST++, FAST-CS)
+
+# draw a row with probability proportional to its weight
+def proportionalSample(cum):
+    """INPUT
+    (np.array)cum: cumulative weights (np.cumsum of non-negative weights)
+
+    OUTPUT
+    (int)row: sampled row (never a row with weight 0)"""
+    row = int(np.searchsorted(cum, random.random() * cum[-1], side="right"))
+    if row >= len(cum):
+        # rounding: fall back to the last row with a positive weight
+        row = int(np.searchsorted(cum, cum[-1], side="left"))
+    return row
+
+# FAST-CS sampling weights
+def csWeights(TS):
+    """INPUT
+    (np.array|csr_matrix)TS: (N x dim) projected test suite
+
+    OUTPUT
+    (np.array)P: probability of being sampled, half uniform and half
+    proportional to the squared distance to the center of mass"""
+    N = TS.shape[0]
+
+    # compute center of mass
+    centerOfMass = np.asarray(TS.mean(axis=0), dtype=np.float64).ravel()
+
+    # compute distances
+    D = sqDistancesTo(TS, centerOfMass, sqNorms(TS))
+    norm = D.sum()
+
+    if norm == 0:
+        return np.full(N, 1.0 / N)
+    return 1.0 / (2*N) + D / (2*norm)
+
+# weighted random order of the rows (Efraimidis-Spirakis exponential keys)
+def weightedOrder(P):
+    """INPUT
+    (np.array)P: non-negative sampling weights
+
+    OUTPUT
+    (np.array)order: all the rows, in the order of a weighted sampling without
+    replacement (rows with weight 0 last): every prefix is a weighted sample"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keys = np.random.exponential(size=len(P)) / P
+    keys[np.isnan(keys)] = np.inf
+    return np.argsort(keys, kind="stable")
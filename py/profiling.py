@@ -0,0 +1,192 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import namedtuple
+from collections import OrderedDict
+import contextlib
+import cProfile
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+"""
+This file implements the profiler of the reduction algorithms. A Profiler
+records the wall time, the CPU time and the peak memory (resident set size,
+and optionally the peak of the memory traced by tracemalloc) of the named
+phases of a run, and can dump a cProfile of one of them. The deadlines of the
+anytime reducers (max_seconds, deadline) are computed and checked here too.
+Every reducer returns its usual tuple of times and selection as a Reduction
+(or AdequateReduction), with named fields and the profiler of the run.
+"""
+
+# phases
+LOAD = "load"            # reading test suites, coverage, stored artifacts
+SHINGLE = "shingle"      # k-shingles of the test cases
+MINHASH = "minhash"      # minhash signatures
+VECTORIZE = "vectorize"  # term-frequency vectors of the test cases
+PROJECT = "project"      # random projection of the vectors
+INDEX = "index"          # LSH index, incidence matrix
+SELECT = "select"        # selection loop of the reduction algorithm
+EVALUATE = "evaluate"    # evaluation of the reduced test suite
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# peak resident set size (bytes) of the process since the last reset
+def peakRSS():
+    try:
+        with open("/proc/self/status") as fin:
+            for line in fin:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# reset the peak resident set size (Linux only, elsewhere it is never reset)
+def resetPeakRSS():
+    try:
+        with open("/proc/self/clear_refs", "w") as fout:
+            fout.write("5")
+    except (IOError, OSError):
+        pass
+
+
+class Profiler(object):
+    """A phase can be entered several times (its measures add up) and phases
+    can be nested (the outer phase includes the inner ones). The peaks of a
+    phase are the maximum memory in use at any time while it was active; the
+    peaks are only reset when a top-level phase is entered, so the peaks of a
+    nested phase include the memory used earlier in the enclosing phase."""
+
+    def __init__(self, traceMemory=False, cprofilePhase=None,
+                 cprofileFile=None):
+        """INPUT
+        (bool)traceMemory: True to also record the tracemalloc peaks (slow)
+        (str)cprofilePhase: phase to run under cProfile (None for none)
+        (str)cprofileFile: where to dump its stats (<cprofilePhase>.prof)"""
+        self.phases = OrderedDict()
+        self.active = []
+        self.traceMemory = traceMemory
+        if traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.cprofilePhase = cprofilePhase
+        self.cprofileFile = cprofileFile or "{}.prof".format(cprofilePhase)
+        self.cprofile = None
+
+    # fold the current peaks into the active phases
+    def updatePeaks(self):
+        rss = peakRSS()
+        traced = tracemalloc.get_traced_memory()[1] if self.traceMemory else 0
+        for stats in self.active:
+            stats["peak_rss"] = max(stats["peak_rss"], rss)
+            if self.traceMemory:
+                stats["peak_traced"] = max(stats["peak_traced"], traced)
+
+    def resetPeaks(self):
+        resetPeakRSS()
+        if self.traceMemory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stats = self.phases.setdefault(name, OrderedDict(
+            [("calls", 0), ("wall", 0.0), ("cpu", 0.0), ("peak_rss", 0),
+             ("peak_traced", 0 if self.traceMemory else None)]))
+        self.updatePeaks()
+        # the peak RSS is process-wide: resetting it inside a phase would lose
+        # the peak of the enclosing ones
+        if not self.active:
+            self.resetPeaks()
+        self.active.append(stats)
+
+        profiled = name == self.cprofilePhase
+        if profiled:
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats["wall"] += time.perf_counter() - wall
+            stats["cpu"] += time.process_time() - cpu
+            stats["calls"] += 1
+            if profiled:
+                self.cprofile.disable()
+                self.cprofile.dump_stats(self.cprofileFile)
+            self.updatePeaks()
+            self.active.remove(stats)
+
+    # measures of each phase, in order of first use (JSON values)
+    def report(self):
+        return OrderedDict((name, dict(stats))
+                           for name, stats in self.phases.items())
+
+# phase of an optional profiler (nothing is recorded if profiler is None)
+def phase(profiler, name):
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# absolute wall-clock time at which an anytime reducer stops (None: never)
+def stopTime(max_seconds=None, deadline=None):
+    if max_seconds is not None:
+        stop = time.time() + max_seconds
+        deadline = stop if deadline is None else min(deadline, stop)
+    return deadline
+
+def expired(deadline):
+    return deadline is not None and time.time() >= deadline
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# output of a budget reducer: preparation time, reduction time, selection
+class Reduction(namedtuple("Reduction", ["pTime", "rTime", "selection"])):
+    profiler = None
+
+    def report(self):
+        return self.profiler.report() if self.profiler is not None else {}
+
+# output of an adequate reducer: preparation time, coverage loading time,
+# reduction time, selection
+class AdequateReduction(namedtuple("AdequateReduction",
+                                   ["pTime", "cTime", "rTime", "selection"])):
+    profiler = None
+
+    def report(self):
+        return self.profiler.report() if self.profiler is not None else {}
+
+def reduction(profiler, pTime, rTime, selection):
+    result = Reduction(pTime, rTime, selection)
+    result.profiler = profiler
+    return result
+
+def adequateReduction(profiler, pTime, cTime, rTime, selection):
+    result = AdequateReduction(pTime, cTime, rTime, selection)
+    result.profiler = profiler
+    return result
@@ -0,0 +1,83 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import sys
+
+import competitors
+import fastr
+
+"""
+This file streams the test cases selected by a reduction algorithm to stdout,
+one test case ID (line number in the input file) per line, as soon as they are
+selected, so that a test runner can start executing them in a pipeline.
+The selection stops at the budget or after the time limit, whichever is first.
+"""
+
+
+usage = """USAGE: python3 py/stream.py <algorithm> <inputFile> <budget> <maxSeconds>
+OPTIONS:
+  <algorithm>: the test suite reduction algorithm.
+    options: FAST++, FAST-CS, FAST-pw, FAST-all (bbox input file)
+             GA, ART-D, ART-F (coverage input file)
+  <inputFile>: the test suite, e.g. input/flex_v3/flex-bbox.txt
+  <budget>: number of test cases to select.
+    options: positive integer value, or 0 for the whole test suite
+  <maxSeconds>: time limit of the selection, in seconds.
+    options: positive value, or 0 for no limit"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print(usage)
+        exit()
+
+    script, alg, inputFile, budget, maxSeconds = sys.argv
+    B = int(budget)
+    max_seconds = float(maxSeconds) if float(maxSeconds) > 0 else None
+
+    # FAST parameters
+    k, n, r, b = 5, 10, 1, 10
+    dim = 10
+
+    # FAST-f sample size
+    def all_(x): return x
+
+    if alg == "FAST++":
+        selection = fastr.fastPlusPlusStream(inputFile, dim=dim, B=B, max_seconds=max_seconds)
+    elif alg == "FAST-CS":
+        selection = fastr.fastCSStream(inputFile, dim=dim, B=B, max_seconds=max_seconds)
+    elif alg == "FAST-pw":
+        selection = fastr.fast_pwStream(inputFile, r, b, bbox=True, k=k, memory=True, B=B, max_seconds=max_seconds)
+    elif alg == "FAST-all":
+        selection = fastr.fast_Stream(inputFile, all_, r, b, bbox=True, k=k, memory=True, B=B, max_seconds=max_seconds)
+    elif alg == "GA":
+        selection = competitors.gaStream(inputFile, B=B, max_seconds=max_seconds)
+    elif alg == "ART-D":
+        selection = competitors.artdStream(inputFile, B=B, max_seconds=max_seconds)
+    elif alg == "ART-F":
+        selection = competitors.artfStream(inputFile, B=B, max_seconds=max_seconds)
+    else:
+        print(usage)
+        exit()
+
+    try:
+        for tc in selection:
+            sys.stdout.write("{}\n".format(tc))
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # the consumer stopped reading: stop selecting
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
@@ -0,0 +1,257 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import pickle
+import sys
+
+import numpy as np
+
+"""
+This file generates synthetic test suites of any size, in the formats of the
+subjects in input/: a bbox file (one test case per line), a coverage file
+(space-separated covered entities per line) and a fault matrix (pickle of a
+dict, key=tcID, val=[detected faults]). The test cases are variations of a
+number of cluster prototypes, a fraction of them are exact duplicates of
+earlier test cases, and the faults are detected by the test cases of the
+cluster they belong to. Test case i is generated from its own seeded random
+generator, so the files are streamed to disk in constant memory (duplicates
+regenerate the test case they copy) and the output only depends on the seed.
+"""
+
+# kinds of random generators
+FAULTS, CLUSTER, TEST_CASE = 0, 1, 2
+
+# default parameters of the generator
+PARAMETERS = {
+    "clusters": 100,     # number of cluster prototypes
+    "skew": 1.0,         # cluster sizes: 1 uniform, > 1 few large clusters
+    "duplicates": 0.1,   # fraction of exact duplicates of earlier test cases
+    "mutation": 0.1,     # fraction of the prototype changed in a test case
+    "length": 50,        # average number of tokens of a bbox line
+    "vocabulary": 100000,  # number of distinct bbox tokens
+    "entities": 10000,   # number of coverable entities
+    "density": 0.05,     # average fraction of the entities covered
+    "faults": 20,        # number of faults
+    "detection": 0.3,    # probability that a test case detects a fault of
+                         # its cluster
+}
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class Generator(object):
+    """Test case i (1-based) is a copy of the prototype of a random cluster:
+    each token of the bbox line and each covered entity is replaced with
+    probability mutation. With probability duplicates, test case i is instead
+    an exact duplicate of a random earlier test case."""
+
+    def __init__(self, seed=0, **parameters):
+        unknown = set(parameters) - set(PARAMETERS)
+        if unknown:
+            raise ValueError("unknown parameters: {}".format(
+                ", ".join(sorted(unknown))))
+        if not 0 <= seed < 2 ** 32:
+            raise ValueError("seed must be in [0, 2**32)")
+        self.seed = seed
+        self.params = dict(PARAMETERS, **parameters)
+        for name in ("skew", "length", "vocabulary", "entities", "clusters"):
+            if self.params[name] <= 0:
+                raise ValueError("{} must be positive".format(name))
+        for name in ("duplicates", "mutation", "density", "detection"):
+            if not 0 <= self.params[name] <= 1:
+                raise ValueError("{} must be in [0, 1]".format(name))
+
+        # faults of each cluster
+        self.clusterFaults = [[] for _ in range(self.params["clusters"])]
+        rng = self.rng(FAULTS, 0)
+        for fault in range(1, self.params["faults"] + 1):
+            self.clusterFaults[rng.randint(self.params["clusters"])].append(
+                fault)
+        self.clusterFaults = [np.array(faults, dtype=np.int64)
+                              for faults in self.clusterFaults]
+        # cluster prototypes, built on first use
+        self.prototypes = {}
+        # text of the tokens and of the entities (faster than formatting them)
+        self.tokens = np.array(["-P[arg{}]".format(token) for token in
+                                range(self.params["vocabulary"])], dtype=object)
+        self.entities = np.array([str(entity) for entity in
+                                  range(self.params["entities"])], dtype=object)
+
+    # random generator of an item (independent of the others)
+    def rng(self, kind, i):
+        return np.random.RandomState([self.seed, kind, i])
+
+    # bbox tokens and covered entities of the prototype of cluster c
+    def prototype(self, c):
+        if c not in self.prototypes:
+            p = self.params
+            rng = self.rng(CLUSTER, c)
+            length = max(1, int(round(rng.normal(p["length"],
+                                                 p["length"] / 4.0))))
+            tokens = rng.randint(p["vocabulary"], size=length)
+            covered = max(1, min(p["entities"], int(round(
+                p["density"] * p["entities"] * rng.uniform(0.5, 1.5)))))
+            self.prototypes[c] = (tokens, rng.choice(
+                p["entities"], size=covered, replace=False))
+        return self.prototypes[c]
+
+    # ID of the test case generated by test case i (i itself, or the earlier
+    # test case it duplicates) and its random generator
+    def original(self, i):
+        while True:
+            rng = self.rng(TEST_CASE, i)
+            if i > 1 and rng.random_sample() < self.params["duplicates"]:
+                i = int(rng.randint(1, i))
+            else:
+                return i, rng
+
+    def testCase(self, i):
+        """INPUT
+        (int)i: ID of the test case (1-based)
+
+        OUTPUT
+        (tuple)(line, covered, faults): bbox line, sorted covered entities (as
+        strings) and detected faults of test case i"""
+        p = self.params
+        i, rng = self.original(i)
+        c = min(int(p["clusters"] * rng.random_sample() ** p["skew"]),
+                p["clusters"] - 1)
+        tokens, covered = self.prototype(c)
+
+        tokens = self.mutate(rng, tokens, p["vocabulary"])
+        covered = np.sort(self.mutate(rng, covered, p["entities"]))
+        covered = covered[np.append(True, covered[1:] != covered[:-1])]
+        faults = self.clusterFaults[c]
+        faults = faults[rng.random_sample(len(faults)) < p["detection"]]
+
+        line = " ".join(self.tokens[tokens].tolist())
+        return line, self.entities[covered].tolist(), faults.tolist()
+
+    # replace each value with a random one in [0, values), with probability
+    # mutation
+    def mutate(self, rng, array, values):
+        mutated = rng.random_sample(len(array)) < self.params["mutation"]
+        array = array.copy()
+        array[mutated] = rng.randint(values, size=int(mutated.sum()))
+        return array
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class PickleDictWriter(object):
+    """Write a pickled dict one item at a time: the items are pickled in
+    batches of SETITEMS, so the dict is never held in memory (the file is read
+    back by pickle.load as a single dict)"""
+
+    BATCH = 1000
+
+    def __init__(self, fout):
+        self.fout = fout
+        self.batch = []
+        # protocol 2 (no frames), empty dict
+        fout.write(pickle.PROTO + bytes([2]) + pickle.EMPTY_DICT)
+
+    # pickle opcodes of an object (without protocol header and STOP)
+    @staticmethod
+    def opcodes(obj):
+        return pickle.dumps(obj, protocol=2)[2:-1]
+
+    def add(self, key, value):
+        self.batch.append(self.opcodes(key) + self.opcodes(value))
+        if len(self.batch) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.fout.write(pickle.MARK + b"".join(self.batch) +
+                            pickle.SETITEMS)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.fout.write(pickle.STOP)
+
+
+# generate a synthetic subject in directory
+def generate(directory, prog, N, seed=0, covType="function", **parameters):
+    """INPUT
+    (str)directory: output directory, e.g. input/synthetic_v0
+    (str)prog: name of the subject, prefix of the file names
+    (int)N: number of test cases
+    (int)seed: seed of the random generators
+    (str)covType: coverage type, suffix of the coverage file
+    parameters: parameters of the generator (see PARAMETERS)
+
+    OUTPUT
+    (tuple)(bboxFile, coverageFile, faultMatrix): paths of the generated files
+    <prog>-bbox.txt, <prog>-<covType>.txt and fault_matrix_key_tc.pickle"""
+    generator = Generator(seed, **parameters)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    bboxFile = os.path.join(directory, "{}-bbox.txt".format(prog))
+    coverageFile = os.path.join(directory, "{}-{}.txt".format(prog, covType))
+    faultMatrix = os.path.join(directory, "fault_matrix_key_tc.pickle")
+
+    with open(bboxFile, "w") as bbox, open(coverageFile, "w") as coverage, \
+         open(faultMatrix, "wb") as fout:
+        faults = PickleDictWriter(fout)
+        for tcID in range(1, N + 1):
+            line, covered, detected = generator.testCase(tcID)
+            bbox.write(line + "\n")
+            coverage.write(" ".join(covered) + " \n")
+            if detected:
+                faults.add(tcID, detected)
+        faults.close()
+
+    return bboxFile, coverageFile, faultMatrix
+
+
+usage = """USAGE: python3 py/synthetic.py <outputDirectory> <program> <numOfTestCases> <seed> [<parameter>=<value> ...]
+OPTIONS:
+  <outputDirectory>: where to write the subject, e.g. input/synthetic_v0
+  <program>: name of the subject, e.g. synthetic
+  <numOfTestCases>: number of test cases, e.g. 1000000
+  <seed>: seed of the random generators (same seed, same test suite)
+  <parameter>=<value>: parameters of the generator (defaults):
+    clusters=100: number of clusters of similar test cases
+    skew=1.0: cluster sizes, 1 for uniform, > 1 for few large clusters
+    duplicates=0.1: fraction of exact duplicates of earlier test cases
+    mutation=0.1: fraction of the cluster prototype changed in a test case
+    length=50: average number of tokens of a bbox line
+    vocabulary=100000: number of distinct bbox tokens
+    entities=10000: number of coverable entities
+    density=0.05: average fraction of the entities covered by a test case
+    faults=20: number of faults
+    detection=0.3: probability that a test case detects a fault of its
+      cluster"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print(usage)
+        exit()
+
+    script, directory, prog, N, seed = sys.argv[:5]
+    parameters = {}
+    for option in sys.argv[5:]:
+        name, _, value = option.partition("=")
+        if name not in PARAMETERS:
+            print(usage)
+            exit()
+        parameters[name] = type(PARAMETERS[name])(value)
+
+    for path in generate(directory, prog, int(N), int(seed), **parameters):
+        print(path)
@@ -0,0 +1,185 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import itertools
+import random
+import sys
+import time
+
+import fastr
+import lsh
+
+"""
+This file tunes the LSH parameters (n, b, r) of FAST-pw and FAST-f on a sample
+of a test suite: for each configuration it measures the minhash estimation
+error (jSimilarityEstimate vs jSimilarity), the recall of LSHCandidates on the
+pairs of test cases whose similarity is at least a threshold, the time spent
+minhashing, building the LSH bucket and querying it, and a deterministic cost
+(hash evaluations, bucket operations and candidates per test case). The
+configuration meeting the target recall at the lowest cost is stored as a
+profile that fast_pw/fast_ can load (profile=...).
+"""
+
+# number of hash functions tried by default
+NS = [4, 6, 8, 10, 12, 16, 20, 24, 32, 48, 64]
+# timed runs of each measure (the best one is kept)
+REPEAT = 5
+
+
+# all (b, r) with b*r = n
+def bandings(n):
+    return [(n // r, r) for r in range(1, n + 1) if n % r == 0]
+
+# best time of repeated runs of a function
+def bestTime(run, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+# deterministic cost of a configuration, in operations per test case: its
+# shingles are hashed n times, it is inserted in b buckets, and a query packs
+# n values into b band keys, looks up b buckets and returns the candidates
+def cost(n, b, shingles, candidates):
+    return n * shingles + b + (n + b) + candidates
+
+# measure one (n, b, r) configuration on the sampled test cases
+def measure(tcIDs, shingles, signatures, exact, threshold, b, r):
+    """INPUT
+    (list)tcIDs: IDs of the sampled test cases
+    (list)shingles: uint64 shingle IDs of the sampled test cases
+    (np.array)signatures: (S x n) signatures of the sampled test cases
+    (dict)exact: key=(i, j) pair of rows, val=exact jaccard similarity
+    (float)threshold: pairs with similarity >= threshold should collide
+    (int)b: number of bands
+    (int)r: number of rows
+
+    OUTPUT
+    (dict)measures: recall, error, candidates, cost, and mhTime, bTime
+    (bucket build) and qTime per test case"""
+    n = b * r
+    S = len(tcIDs)
+
+    mhTime = bestTime(lambda: lsh.minhashSignatures(shingles, n)) / S
+
+    minhashes = list(zip(range(S), signatures))
+    bTime = bestTime(lambda: lsh.LSHBucket(minhashes, b, r, n)) / S
+    bucket = lsh.LSHBucket(minhashes, b, r, n)
+
+    def query():
+        return [lsh.LSHCandidates(bucket, (0, signatures[i]), b, r, n)
+                for i in range(S)]
+    qTime = bestTime(query) / S
+    candidates = query()
+
+    similar, found, error = 0, 0, 0.0
+    for (i, j), sim in exact.items():
+        estimate = lsh.jSimilarityEstimate(signatures[i], signatures[j])
+        error += abs(estimate - sim)
+        if sim >= threshold:
+            similar += 1
+            if j in candidates[i]:
+                found += 1
+
+    meanCandidates = sum(len(c) - 1 for c in candidates) / float(S)
+    meanShingles = sum(len(s) for s in shingles) / float(S)
+    return {"n": n, "b": b, "r": r,
+            "recall": float(found) / similar if similar > 0 else 1.0,
+            "error": error / len(exact) if len(exact) > 0 else 0.0,
+            "candidates": meanCandidates,
+            "cost": cost(n, b, meanShingles, meanCandidates),
+            "mhTime": mhTime, "bTime": bTime, "qTime": qTime}
+
+# tune the LSH parameters on a sample of the input test suite
+def tune(input_file, bbox=False, k=5, threshold=0.8, recall=0.9,
+         sample=200, ns=NS):
+    """INPUT
+    (str)input_file: test suite (bbox or wbox)
+    (bool)bbox: True if input_file is a bbox representation
+    (int)k: size of k-shingles (bbox only)
+    (float)threshold: similarity above which test cases should be candidates
+    (float)recall: target candidate recall
+    (int)sample: number of sampled test cases
+    (list)ns: numbers of hash functions to try
+
+    OUTPUT
+    (pair)(best, measures): configuration meeting the target recall at the
+    lowest cost, then time (the one with the highest recall if none does),
+    and all measures"""
+    TS = fastr.loadTestSuite(input_file, bbox=bbox, k=k)
+    tcIDs = random.sample(list(TS.keys()), min(sample, len(TS)))
+    shingles = [lsh.shingleIDs(TS[tcID]) for tcID in tcIDs]
+    sets = [set(s.tolist()) for s in shingles]
+
+    exact = {}
+    for i, j in itertools.combinations(range(len(tcIDs)), 2):
+        if len(sets[i] | sets[j]) > 0:
+            exact[(i, j)] = lsh.jSimilarity(sets[i], sets[j])
+
+    # the first n values of a signature do not depend on n
+    allSignatures = lsh.minhashSignatures(shingles, max(ns))
+
+    measures = []
+    for n in ns:
+        for b, r in bandings(n):
+            measures.append(measure(tcIDs, shingles, allSignatures[:, :n],
+                                    exact, threshold, b, r))
+
+    valid = [m for m in measures if m["recall"] >= recall]
+    if len(valid) > 0:
+        best = min(valid, key=lambda m: (
+            m["cost"], m["mhTime"] + m["bTime"] + m["qTime"], m["n"]))
+    else:
+        best = max(measures, key=lambda m: (m["recall"], -m["n"]))
+
+    return best, measures
+
+
+usage = """USAGE: python3 py/tuneLSH.py <inputFile> <bbox> <threshold> <recall> <profileFile>
+OPTIONS:
+  <inputFile>: the test suite, e.g. input/flex_v3/flex-bbox.txt
+  <bbox>: True for bbox representations, False for coverage (wbox) files
+  <threshold>: similarity above which two test cases should be candidates.
+    options: float value in [0, 1], e.g. 0.8
+  <recall>: target candidate recall on the sampled pairs.
+    options: float value in [0, 1], e.g. 0.9
+  <profileFile>: output profile, to be passed to fast_pw/fast_ (profile=...)"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 6:
+        print(usage)
+        exit()
+
+    script, inputFile, bbox, threshold, recall, profileFile = sys.argv
+    k = 5
+
+    best, measures = tune(inputFile, bbox=(bbox == "True"), k=k,
+                          threshold=float(threshold), recall=float(recall))
+
+    print("n b r recall error candidates cost mhTime bTime qTime")
+    for m in measures:
+        print(m["n"], m["b"], m["r"], round(m["recall"], 4),
+              round(m["error"], 4), round(m["candidates"], 2),
+              round(m["cost"], 2), m["mhTime"], m["bTime"], m["qTime"])
+
+    profile = dict(best)
+    profile.update({"input": inputFile, "bbox": bbox == "True", "k": k,
+                    "threshold": float(threshold), "target": float(recall)})
+    lsh.storeProfile(profileFile, profile)
+    print("Recommended: n={} b={} r={} (recall {})".format(
+        best["n"], best["b"], best["r"], round(best["recall"], 4)))